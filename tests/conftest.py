@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pytest
 from django.conf import settings
+from django.core.cache import cache
 from pytest_factoryboy import register
 
 from wine_cellar.apps.storage.tests.factories import StorageFactory, StorageItemFactory
@@ -31,6 +32,12 @@ register(StorageFactory)
 register(StorageItemFactory)
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def clear_image_folder():
     yield
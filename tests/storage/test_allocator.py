@@ -0,0 +1,156 @@
+import threading
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from wine_cellar.apps.storage.allocator import (
+    SlotUnavailable,
+    allocate_slot,
+    allocate_slots,
+    find_free_slots,
+    move_items,
+)
+from wine_cellar.apps.storage.models import Storage, StorageItem
+
+
+@pytest.mark.django_db
+def test_allocate_next_free_slot(storage_factory, user, wine_factory):
+    storage = storage_factory(user=user, rows=2, columns=2)
+    wine = wine_factory(user=user)
+    allocate_slot(storage, wine, user, row=1, column=1)
+    item = allocate_slot(storage, wine, user)
+    assert (item.row, item.column) == (1, 2)
+    # soft deleted items free their slot
+    StorageItem.objects.filter(row=1, column=1).update(deleted=True)
+    assert not storage.is_slot_occupied(1, 1)
+    item = allocate_slot(storage, wine, user)
+    assert (item.row, item.column) == (1, 1)
+    with pytest.raises(SlotUnavailable):
+        allocate_slot(storage, wine, user, row=1, column=2)
+
+
+@pytest.mark.django_db
+def test_allocate_without_slots(user, wine_factory):
+    storage = Storage.objects.get(user=user)
+    wine = wine_factory(user=user)
+    item = allocate_slot(storage, wine, user)
+    assert item.row is None
+    assert item.column is None
+
+
+def test_find_free_slots_nearest_to_hint():
+    storage = Storage(rows=3, columns=3)
+    occupied = {(2, 2), (2, 3)}
+    assert find_free_slots(storage, occupied) == [(1, 1)]
+    assert find_free_slots(storage, occupied, 3) == [(1, 1), (1, 2), (1, 3)]
+    assert find_free_slots(storage, occupied, 3, hint=(2, 2)) == [
+        (1, 2),
+        (2, 1),
+        (3, 2),
+    ]
+    assert find_free_slots(storage, occupied, hint=(3, 3)) == [(3, 3)]
+    full = {(row, column) for row in range(1, 4) for column in range(1, 4)}
+    assert find_free_slots(storage, full) == []
+
+
+@pytest.mark.django_db
+def test_allocate_many_bottles_with_constant_queries(
+    storage_factory, user, wine_factory
+):
+    storage = storage_factory(user=user, rows=4, columns=4)
+    wine = wine_factory(user=user)
+    with CaptureQueriesContext(connection) as single:
+        allocate_slot(storage, wine, user, row=2, column=2)
+    with CaptureQueriesContext(connection) as many:
+        items = allocate_slots(storage, wine, user, 12, price=10)
+    assert len(many) == len(single)
+    assert len(items) == 12
+    assert all(item.pk and item.price == 10 for item in items)
+    assert (2, 2) not in {(item.row, item.column) for item in items}
+    with pytest.raises(SlotUnavailable, match="only 3 free slots"):
+        allocate_slots(storage, wine, user, 4)
+    items = allocate_slots(storage, wine, user, 3, row=4, column=4)
+    assert {(item.row, item.column) for item in items} == {(4, 2), (4, 3), (4, 4)}
+
+
+def run_concurrently(count, target):
+    barrier = threading.Barrier(count)
+    results = []
+
+    def run():
+        barrier.wait()
+        try:
+            results.append(target())
+        except SlotUnavailable as e:
+            results.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_allocations_never_share_a_slot(storage_factory, user, wine_factory):
+    storage = storage_factory(user=user, rows=2, columns=3)
+    wine = wine_factory(user=user)
+
+    results = run_concurrently(8, lambda: allocate_slot(storage, wine, user))
+    items = [result for result in results if isinstance(result, StorageItem)]
+    assert len(items) == 6
+    assert len({(item.row, item.column) for item in items}) == 6
+    assert sum(isinstance(result, SlotUnavailable) for result in results) == 2
+
+    StorageItem.objects.filter(row=1, column=1).update(deleted=True)
+    results = run_concurrently(
+        4, lambda: allocate_slot(storage, wine, user, row=1, column=1)
+    )
+    assert sum(isinstance(result, StorageItem) for result in results) == 1
+    assert StorageItem.objects.filter(deleted=False).count() == 6
+
+
+@pytest.mark.django_db
+def test_move_items(storage_factory, user, wine_factory):
+    source = storage_factory(user=user, rows=1, columns=3)
+    target = storage_factory(user=user, rows=2, columns=2)
+    wine = wine_factory(user=user)
+    items = allocate_slots(source, wine, user, 3, price=12)
+    allocate_slot(target, wine, user, row=1, column=1)
+    with CaptureQueriesContext(connection) as queries:
+        moved = move_items(items, target)
+    assert sum("UPDATE" in query["sql"] for query in queries) == 1
+    assert [(item.row, item.column) for item in moved] == [(1, 2), (2, 1), (2, 2)]
+    for item in StorageItem.objects.filter(pk__in=[item.pk for item in items]):
+        assert item.storage == target
+        assert item.price == 12
+        assert not item.deleted
+    assert StorageItem.objects.filter(deleted=True).count() == 0
+
+
+@pytest.mark.django_db
+def test_move_items_swap_and_validate(storage_factory, user, wine_factory):
+    storage = storage_factory(user=user, rows=2, columns=2)
+    wine = wine_factory(user=user)
+    first, second = allocate_slots(storage, wine, user, 2)
+    move_items([first, second], storage, slots=[(1, 2), (1, 1)])
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert (first.row, first.column) == (1, 2)
+    assert (second.row, second.column) == (1, 1)
+    third = allocate_slot(storage, wine, user)
+    # nothing is moved if one of the targets is taken
+    with pytest.raises(SlotUnavailable):
+        move_items([first, second], storage, slots=[(2, 2), (2, 1)])
+    with pytest.raises(SlotUnavailable):
+        move_items([first, second], storage, slots=[(2, 2), (3, 1)])
+    with pytest.raises(SlotUnavailable):
+        move_items(
+            [first, second, third], storage_factory(user=user, rows=1, columns=2)
+        )
+    first.refresh_from_db()
+    assert (first.row, first.column) == (1, 2)
@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from wine_cellar.apps.storage.models import ArchivedStorageItem, StorageItem
+from wine_cellar.apps.storage.tasks import archive_storage_items
+
+
+@pytest.mark.django_db
+def test_archive_storage_items(user, storage_item_factory):
+    old = timezone.now() - timedelta(days=100)
+    items = storage_item_factory.create_batch(
+        5, user=user, deleted=True, consumed_at=old, price=9, rating=7
+    )
+    live = storage_item_factory(user=user)
+    recent = storage_item_factory(user=user, deleted=True, consumed_at=timezone.now())
+
+    assert archive_storage_items(batch_size=2) == 5
+    assert set(StorageItem.objects.values_list("pk", flat=True)) == {
+        live.pk,
+        recent.pk,
+    }
+    archived = ArchivedStorageItem.objects.get(pk=items[0].pk)
+    assert archived.wine_id == items[0].wine_id
+    assert archived.price == 9
+    assert archived.rating == 7
+    assert archived.created == items[0].created
+    assert archived.consumed_at == old
+    assert archive_storage_items() == 0
+
+
+@pytest.mark.django_db
+def test_history_pages_across_archive(client, user, storage_item_factory):
+    now = timezone.now()
+    # the first bottle bought was drunk last
+    items = [
+        storage_item_factory(
+            user=user, deleted=True, consumed_at=now - timedelta(days=20 * i + 20)
+        )
+        for i in range(12)
+    ]
+    storage_item_factory(user=user)
+    archive_storage_items()
+    assert ArchivedStorageItem.objects.count() == 8
+
+    client.force_login(user)
+    r = client.get(reverse("stock-history"))
+    assert r.context["paginator"].count == 12
+    first_page = r.context["storage_items"]
+    assert len(first_page) == 10
+    r = client.get(reverse("stock-history"), {"page": 2})
+    pks = [item.pk for item in first_page + r.context["storage_items"]]
+    assert pks == [item.pk for item in items]
+    assert isinstance(r.context["storage_items"][-1], ArchivedStorageItem)
+
+
+@pytest.mark.django_db
+def test_history_page_reads_only_its_rows(client, user, storage_item_factory):
+    now = timezone.now()
+    for days in range(30):
+        storage_item_factory(
+            user=user, deleted=True, consumed_at=now - timedelta(days=days * 10)
+        )
+    archive_storage_items()
+    assert ArchivedStorageItem.objects.count() == 21
+
+    client.force_login(user)
+    with CaptureQueriesContext(connection) as queries:
+        r = client.get(reverse("stock-history"), {"page": 2})
+    assert r.context["paginator"].count == 30
+    consumed = [item.consumed_at for item in r.context["storage_items"]]
+    assert consumed == [now - timedelta(days=days * 10) for days in range(10, 20)]
+    # each table is read up to the end of the page instead of sorting a union
+    keys = [q["sql"] for q in queries if "ORDER BY" in q["sql"]]
+    assert len(keys) == 2
+    assert all("UNION" not in sql and sql.endswith("LIMIT 20") for sql in keys)
@@ -1,6 +1,8 @@
 from http import HTTPStatus
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from pytest_django.asserts import (
     assertRedirects,
@@ -8,6 +10,12 @@ from pytest_django.asserts import (
 )
 
 from wine_cellar.apps.storage.models import Storage, StorageItem
+from wine_cellar.apps.storage.occupancy import (
+    Occupancy,
+    get_occupancy,
+    storage_version,
+)
+from wine_cellar.apps.wine.tasks import generate_thumbnail
 
 
 @pytest.mark.django_db
@@ -245,6 +253,26 @@ def test_user_can_delete_stock(client, user, wine_factory, storage_item_factory)
     assert StorageItem.objects.count() == 1
     item.refresh_from_db()
     assert item.deleted is True
+    assert item.consumed_at is not None
+
+
+@pytest.mark.django_db
+def test_user_can_rate_consumed_stock(client, user, storage_item_factory):
+    client.force_login(user)
+    item = storage_item_factory(user=user)
+    data = {"rating": 8, "tasting_note": "Ripe cherries"}
+    r = client.post(reverse("stock-delete", kwargs={"pk": item.pk}), data=data)
+    assert r.status_code == HTTPStatus.FOUND
+    item.refresh_from_db()
+    assert item.deleted is True
+    assert item.rating == 8
+    assert item.tasting_note == "Ripe cherries"
+    r = client.post(
+        reverse("stock-delete", kwargs={"pk": storage_item_factory(user=user).pk}),
+        data={"rating": 11},
+    )
+    assert r.status_code == HTTPStatus.OK
+    assert "rating" in r.context["form"].errors
 
 
 @pytest.mark.django_db
@@ -327,22 +355,326 @@ def test_user_cant_add_to_invalid_slot(client, user, storage_factory, wine_facto
 
 @pytest.mark.django_db
 def test_form_context_has_empty_slots(
-    client, user, storage_factory, storage_item_factory, wine_factory
+    client,
+    django_capture_on_commit_callbacks,
+    user,
+    storage_factory,
+    storage_item_factory,
+    wine_factory,
 ):
     storage = storage_factory(user=user, rows=2, columns=2)
     client.force_login(user)
     wine = wine_factory(user=user)
     r = client.get(reverse("stock-add", kwargs={"pk": wine.pk}))
     assert r.status_code == HTTPStatus.OK
-    assert r.context["free_cells_by_storage"][storage.pk] == {
+    occupancy = Occupancy.from_json(r.context["free_cells_by_storage"][storage.pk])
+    assert occupancy.free_cells() == {
         1: [1, 2],
         2: [1, 2],
     }
-    storage_item_factory(storage=storage, wine=wine, row=1, column=1, user=user)
-    storage_item_factory(storage=storage, wine=wine, row=2, column=2, user=user)
+    with django_capture_on_commit_callbacks(execute=True):
+        storage_item_factory(storage=storage, wine=wine, row=1, column=1, user=user)
+        storage_item_factory(storage=storage, wine=wine, row=2, column=2, user=user)
     r = client.get(reverse("stock-add", kwargs={"pk": wine.pk}))
     assert r.status_code == HTTPStatus.OK
-    assert r.context["free_cells_by_storage"][storage.pk] == {
+    occupancy = Occupancy.from_json(r.context["free_cells_by_storage"][storage.pk])
+    assert occupancy.free_cells() == {
         1: [2],
         2: [1],
     }
+
+
+@pytest.mark.django_db
+def test_occupancy_is_built_with_one_query_and_cached(
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+    user,
+    storage_factory,
+    storage_item_factory,
+    wine_factory,
+):
+    storage = storage_factory(user=user, rows=50, columns=50)
+    other_storage = storage_factory(user=user, rows=3, columns=3)
+    wine = wine_factory(user=user)
+    with django_capture_on_commit_callbacks(execute=True):
+        storage_item_factory(storage=storage, wine=wine, row=50, column=50, user=user)
+        storage_item_factory(storage=storage, wine=wine, row=1, column=2, user=user)
+        storage_item_factory(
+            storage=other_storage, wine=wine, row=2, column=2, user=user, deleted=True
+        )
+    with django_assert_num_queries(1):
+        occupancy = get_occupancy(user)
+    with django_assert_num_queries(0):
+        assert get_occupancy(user) is not None
+    assert occupancy[storage.pk].is_occupied(50, 50)
+    assert occupancy[storage.pk].is_occupied(1, 2)
+    assert not occupancy[storage.pk].is_occupied(2, 1)
+    assert len(occupancy[storage.pk].bitmap) == 313
+    assert not any(occupancy[other_storage.pk].bitmap)
+    # the default storage has no cells
+    assert len(occupancy) == 3
+
+    item = StorageItem.objects.get(storage=storage, row=50)
+    with django_capture_on_commit_callbacks(execute=True):
+        item.deleted = True
+        item.save()
+    assert not get_occupancy(user)[storage.pk].is_occupied(50, 50)
+
+
+@pytest.mark.django_db
+def test_occupancy_kept_when_wine_fields_outside_grid_change(
+    django_capture_on_commit_callbacks, user, wine_factory
+):
+    wine = wine_factory(user=user)
+    version = storage_version(user.pk)
+    with django_capture_on_commit_callbacks(execute=True):
+        wine.comment = "Fruity"
+        wine.save(update_fields=["comment"])
+    assert storage_version(user.pk) == version
+    with django_capture_on_commit_callbacks(execute=True):
+        wine.name = "Riesling"
+        wine.save(update_fields=["name"])
+    assert storage_version(user.pk) != version
+
+
+@pytest.mark.django_db
+def test_user_can_auto_place_stock(
+    client, user, storage_factory, storage_item_factory, wine_factory
+):
+    storage = storage_factory(user=user, rows=2, columns=2)
+    client.force_login(user)
+    wine = wine_factory(user=user)
+    storage_item_factory(storage=storage, wine=wine, row=1, column=1, user=user)
+    data = {"storage": storage.pk, "auto_place": True}
+    r = client.post(reverse("stock-add", kwargs={"pk": wine.pk}), data=data)
+    assert r.status_code == HTTPStatus.FOUND
+    item = storage.items.latest("pk")
+    assert (item.row, item.column) == (1, 2)
+
+
+@pytest.mark.django_db
+def test_user_can_add_many_bottles(client, user, storage_factory, wine_factory):
+    storage = storage_factory(user=user, rows=3, columns=3)
+    client.force_login(user)
+    wine = wine_factory(user=user)
+    data = {"storage": storage.pk, "row": 2, "column": 2, "quantity": 5, "price": 12}
+    r = client.post(reverse("stock-add", kwargs={"pk": wine.pk}), data=data)
+    assert r.status_code == HTTPStatus.FOUND
+    items = storage.items.all()
+    assert len(items) == 5
+    assert {(item.row, item.column) for item in items} == {
+        (2, 2),
+        (1, 2),
+        (2, 1),
+        (2, 3),
+        (3, 2),
+    }
+    data["quantity"] = 5
+    data["auto_place"] = True
+    r = client.post(reverse("stock-add", kwargs={"pk": wine.pk}), data=data)
+    assert r.status_code == HTTPStatus.OK
+    assert "only 4 free slots" in str(r.context["form"].non_field_errors())
+    assert storage.items.count() == 5
+
+
+@pytest.mark.django_db
+def test_storage_list_query_count_is_constant(
+    client, user, storage_factory, storage_item_factory, wine_factory
+):
+    client.force_login(user)
+    wine = wine_factory(user=user)
+    storage = storage_factory(user=user, rows=2, columns=3)
+    storage_item_factory(storage=storage, wine=wine, row=1, column=1, user=user)
+    storage_item_factory(
+        storage=storage, wine=wine, row=1, column=2, user=user, deleted=True
+    )
+    with CaptureQueriesContext(connection) as few:
+        r = client.get(reverse("storage-list"))
+    assert "<td>1</td>" in r.content.decode()
+    assert "<td>6</td>" in r.content.decode()
+    for _ in range(5):
+        storage_item_factory(storage=storage_factory(user=user), wine=wine, user=user)
+    with CaptureQueriesContext(connection) as many:
+        client.get(reverse("storage-list"))
+    assert len(many) == len(few)
+
+    r = client.get(reverse("storage-detail", kwargs={"pk": storage.pk}))
+    assert r.context["storage"].used_slots == 1
+    assert r.context["storage"].total_slots == 6
+    assert not r.context["storage"].is_full
+
+
+@pytest.mark.django_db
+def test_storage_grid(
+    client,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+    user,
+    user_factory,
+    storage_factory,
+    storage_item_factory,
+    wine_factory,
+):
+    client.force_login(user)
+    storage = storage_factory(user=user, rows=3, columns=4)
+    merlot = wine_factory(user=user, name="Merlot", vintage=2019)
+    riesling = wine_factory(user=user, name="Riesling", vintage=None)
+    with django_capture_on_commit_callbacks(execute=True):
+        for row, column, wine in [(1, 2, merlot), (1, 3, merlot), (3, 4, riesling)]:
+            storage_item_factory(
+                storage=storage, wine=wine, row=row, column=column, user=user
+            )
+        storage_item_factory(storage=storage, wine=riesling, user=user)
+    url = reverse("storage-grid", kwargs={"pk": storage.pk})
+
+    # session, user, storage, the grid itself and the front images
+    with django_assert_num_queries(5):
+        r = client.get(url)
+    assert r.status_code == HTTPStatus.OK
+    grid = r.json()
+    assert grid["rows"] == 3
+    assert grid["columns"] == 4
+    assert [wine["label"] for wine in grid["wines"]] == ["Merlot 2019", "Riesling"]
+    assert grid["wines"][0]["url"] == reverse("wine-detail", kwargs={"pk": merlot.pk})
+    assert grid["cells"] == [0, 1, 1, 2, 0, 8, 2, 1]
+    assert grid["unplaced"] == 1
+    # the slots are cached until the storages change
+    with django_assert_num_queries(4):
+        client.get(url)
+    with django_capture_on_commit_callbacks(execute=True):
+        merlot.name = "Cabernet"
+        merlot.save()
+    grid = client.get(url).json()
+    assert grid["wines"][0]["label"] == "Cabernet 2019"
+
+    other_storage = storage_factory(user=user_factory())
+    r = client.get(reverse("storage-grid", kwargs={"pk": other_storage.pk}))
+    assert r.status_code == HTTPStatus.NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_storage_grid_shows_thumbnails_generated_later(
+    clear_image_folder,
+    client,
+    user,
+    storage_factory,
+    storage_item_factory,
+    wine_image_factory,
+):
+    client.force_login(user)
+    storage = storage_factory(user=user, rows=1, columns=1)
+    item = storage_item_factory(storage=storage, row=1, column=1, user=user)
+    # the thumbnail is generated after the commit
+    image = wine_image_factory(wine=item.wine, user=user)
+    url = reverse("storage-grid", kwargs={"pk": storage.pk})
+    wine = client.get(url).json()["wines"][0]
+    assert wine["image"] == image.pk
+    assert wine["thumbnail"] is None
+
+    generate_thumbnail(image.pk)
+    image.refresh_from_db()
+    wine = client.get(url).json()["wines"][0]
+    assert wine["thumbnail"] == image.thumbnail.url
+
+    image.delete()
+    wine = client.get(url).json()["wines"][0]
+    assert wine["image"] is None
+    assert wine["thumbnail"] is None
+
+
+@pytest.mark.django_db
+def test_storage_detail_keyset_pagination(
+    client, user, storage_factory, storage_item_factory, wine_factory
+):
+    client.force_login(user)
+    storage = storage_factory(user=user, rows=4, columns=4)
+    for row in range(4, 0, -1):
+        for column in range(1, 5):
+            storage_item_factory(
+                storage=storage,
+                wine=wine_factory(user=user),
+                row=row,
+                column=column,
+                user=user,
+            )
+    unplaced = storage_item_factory.create_batch(
+        3, storage=storage, row=None, column=None, user=user
+    )
+    url = reverse("storage-detail", kwargs={"pk": storage.pk})
+
+    slots = []
+    r = client.get(url)
+    while True:
+        slots += [(item.row, item.column) for item in r.context["object_list"]]
+        cursor = r.context["next_cursor"]
+        if not cursor:
+            break
+        r = client.get(url, {"after": cursor})
+    assert slots == [(None, None)] * 3 + [
+        (row, column) for row in range(1, 5) for column in range(1, 5)
+    ]
+    r = client.get(url, {"after": unplaced[1].pk})
+    assert r.context["object_list"][0] == unplaced[2]
+
+    # wines are fetched together with the items
+    with CaptureQueriesContext(connection) as last_page:
+        r = client.get(url, {"after": "4.2.0"})
+    assert [(item.row, item.column) for item in r.context["object_list"]] == [
+        (4, 2),
+        (4, 3),
+        (4, 4),
+    ]
+    item_queries = [q for q in last_page if 'FROM "storage_storageitem"' in q["sql"]]
+    assert len(item_queries) == 1
+    if connection.vendor == "sqlite":
+        # the page is read from the live slot index without sorting
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + item_queries[0]["sql"])
+            plan = " ".join(str(step[-1]) for step in cursor.fetchall())
+        assert "storage_live_item_slot_idx" in plan
+        assert "TEMP B-TREE" not in plan
+
+    r = client.get(url, {"row_from": 2, "row_to": 3})
+    assert {item.row for item in r.context["object_list"]} == {2, 3}
+    assert r.context["next_cursor"] is None
+
+
+@pytest.mark.django_db
+def test_user_can_move_stock(client, user, storage_factory, storage_item_factory):
+    source = storage_factory(user=user, rows=2, columns=2)
+    target = storage_factory(user=user, rows=2, columns=2)
+    items = [
+        storage_item_factory(storage=source, row=1, column=column, user=user)
+        for column in (1, 2)
+    ]
+    client.force_login(user)
+    url = reverse("stock-move")
+    r = client.get(url, {"items": [item.pk for item in items]})
+    assert r.status_code == HTTPStatus.OK
+    assertTemplateUsed(response=r, template_name="stock_move.html")
+    assert list(r.context["selected_items"]) == items
+    data = {"items": [item.pk for item in items], "storage": target.pk}
+    data.update(row=2, column=2)
+    r = client.post(url, data=data)
+    assertRedirects(r, reverse("storage-detail", kwargs={"pk": target.pk}))
+    assert {(item.row, item.column) for item in target.items.all()} == {
+        (2, 2),
+        (1, 2),
+    }
+    assert not source.items.exists()
+    assert StorageItem.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_user_cant_move_other_users_stock(
+    client, user, storage_factory, storage_item_factory
+):
+    item = storage_item_factory(row=1, column=1)
+    target = storage_factory(user=user, rows=2, columns=2)
+    client.force_login(user)
+    data = {"items": [item.pk], "storage": target.pk}
+    r = client.post(reverse("stock-move"), data=data)
+    assert r.status_code == HTTPStatus.OK
+    assert "items" in r.context["form"].errors
+    item.refresh_from_db()
+    assert item.storage != target
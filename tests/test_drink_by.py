@@ -2,11 +2,13 @@ from datetime import timedelta
 
 import pytest
 from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from wine_cellar.apps.storage.models import StorageItem
 from wine_cellar.apps.user.views import get_user_settings
-from wine_cellar.apps.wine.models import Wine
+from wine_cellar.apps.wine.models import DrinkByReminder, Wine
 from wine_cellar.apps.wine.tasks import drink_by_reminder
 
 
@@ -44,7 +46,7 @@ def test_drink_by_reminder_not_send_for_other_user(user, user_factory, wine_fact
     date = timezone.now().date() + timedelta(days=14)
     user1 = user_factory(email="user1@example.org")
     wine = wine_factory(drink_by=date, user=user1)
-    wine_1 = wine_factory(drink_by=timezone.now().date(), user=user)
+    wine_1 = wine_factory(drink_by=timezone.now().date() - timedelta(days=1), user=user)
     storage = user.storage_set.first()
     storage_1 = user1.storage_set.first()
     StorageItem.objects.create(wine=wine, storage=storage_1)
@@ -53,3 +55,110 @@ def test_drink_by_reminder_not_send_for_other_user(user, user_factory, wine_fact
     assert Wine.objects.count() == 2
     assert len(mail.outbox) == 1
     assert mail.outbox[0].to == [user1.email]
+
+
+@pytest.mark.django_db
+def test_drink_by_reminder_ignores_deleted_stock(user, wine_factory):
+    date = timezone.now().date() + timedelta(days=14)
+    wine = wine_factory(drink_by=date, user=user)
+    storage = user.storage_set.first()
+    StorageItem.objects.create(wine=wine, storage=storage, deleted=True)
+    drink_by_reminder()
+    assert len(mail.outbox) == 0
+
+
+@pytest.mark.django_db
+def test_drink_by_reminder_batches(user_factory, wine_factory, settings):
+    settings.WINE_REMINDER_BATCH_SIZE = 2
+    date = timezone.now().date() + timedelta(days=14)
+    for i in range(3):
+        user = user_factory(email=f"user{i}@example.org")
+        storage = user.storage_set.first()
+        for name in ("Riesling", "Syrah"):
+            wine = wine_factory(name=name, drink_by=date, user=user)
+            StorageItem.objects.create(wine=wine, storage=storage)
+            StorageItem.objects.create(wine=wine, storage=storage)
+            StorageItem.objects.create(wine=wine, storage=storage, deleted=True)
+    with CaptureQueriesContext(connection) as queries:
+        drink_by_reminder()
+    selects = [q["sql"] for q in queries if q["sql"].startswith("SELECT")]
+    # the horizons, the due users, then the wines of each of the two batches
+    assert len(selects) == 4
+    assert sorted(message.to[0] for message in mail.outbox) == [
+        f"user{i}@example.org" for i in range(3)
+    ]
+    assert "2x Riesling" in mail.outbox[0].body
+    assert "2x Syrah" in mail.outbox[0].body
+
+
+@pytest.mark.django_db
+def test_drink_by_reminder_sent_once(user, wine_factory):
+    today = timezone.now().date()
+    wine = wine_factory(drink_by=today + timedelta(days=14), user=user)
+    StorageItem.objects.create(wine=wine, storage=user.storage_set.first())
+    drink_by_reminder()
+    drink_by_reminder()
+    assert len(mail.outbox) == 1
+    assert DrinkByReminder.objects.get().horizon == 14
+    # a new drink by date is reminded again
+    wine.drink_by = today + timedelta(days=10)
+    wine.save()
+    drink_by_reminder()
+    assert len(mail.outbox) == 2
+
+
+@pytest.mark.django_db
+def test_drink_by_reminder_catches_up(user, wine_factory):
+    today = timezone.now().date()
+    # the run 14 days before was missed
+    wine = wine_factory(drink_by=today + timedelta(days=12), user=user)
+    StorageItem.objects.create(wine=wine, storage=user.storage_set.first())
+    drink_by_reminder()
+    assert len(mail.outbox) == 1
+    assert wine.name in mail.outbox[0].body
+
+
+@pytest.mark.django_db
+def test_drink_by_reminder_horizons(user, wine_factory, monkeypatch):
+    user_settings = get_user_settings(user)
+    user_settings.reminder_days = "3,14"
+    user_settings.save()
+    now = timezone.now()
+    today = now.date()
+    storage = user.storage_set.first()
+    for name, days in (("Riesling", 14), ("Merlot", 2), ("Syrah", 20)):
+        wine = wine_factory(name=name, drink_by=today + timedelta(days=days), user=user)
+        StorageItem.objects.create(wine=wine, storage=storage)
+    drink_by_reminder()
+    assert len(mail.outbox) == 1
+    assert "Riesling" in mail.outbox[0].body
+    assert "Merlot" in mail.outbox[0].body
+    assert "Syrah" not in mail.outbox[0].body
+    # the late first reminder of a wine covers both horizons
+    assert set(
+        DrinkByReminder.objects.filter(wine__name="Merlot").values_list(
+            "horizon", flat=True
+        )
+    ) == {3, 14}
+    monkeypatch.setattr(timezone, "now", lambda: now + timedelta(days=1))
+    drink_by_reminder()
+    assert len(mail.outbox) == 1
+    monkeypatch.setattr(timezone, "now", lambda: now + timedelta(days=11))
+    drink_by_reminder()
+    assert len(mail.outbox) == 2
+    assert "Riesling" in mail.outbox[1].body
+    assert "Syrah" in mail.outbox[1].body
+    assert "Merlot" not in mail.outbox[1].body
+
+
+@pytest.mark.django_db
+def test_drink_by_reminder_ignores_invalid_reminder_days(user, wine_factory):
+    # stored before the days were validated
+    user_settings = get_user_settings(user)
+    user_settings.reminder_days = "9999999,14"
+    user_settings.save()
+    wine = wine_factory(drink_by=timezone.now().date() + timedelta(days=14), user=user)
+    StorageItem.objects.create(wine=wine, storage=user.storage_set.first())
+    drink_by_reminder()
+    assert len(mail.outbox) == 1
+    assert DrinkByReminder.objects.get().horizon == 14
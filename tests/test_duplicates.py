@@ -0,0 +1,111 @@
+import pytest
+from django.urls import reverse
+
+from wine_cellar.apps.wine import duplicates
+from wine_cellar.apps.wine.duplicates import NameIndex, find_duplicates
+from wine_cellar.apps.wine.utils import LRUCache, normalize_name
+
+
+def test_normalize_name():
+    assert normalize_name("Château Margaux") == "chateau margaux"
+    assert normalize_name("  Ch. MARGAUX ") == "chateau margaux"
+    assert normalize_name("St-Émilion Grand Cru") == "saint emilion grand cru"
+    assert normalize_name("Dom. de l'Aigle") == "domaine de l aigle"
+    assert normalize_name("") == ""
+
+
+def test_name_index_search_ranks_by_similarity_vintage_and_vineyard():
+    index = NameIndex()
+    index.add(1, normalize_name("Château Latour"), 2015, [1])
+    index.add(2, normalize_name("Chateau Latour"), 2016, [2])
+    index.add(3, normalize_name("Chateau Latour"), 2015, [2])
+    index.add(4, normalize_name("Domaine Leflaive"), 2015, [1])
+    results = index.search(normalize_name("Ch. Latour"), 2015, [1], 0.5)
+    assert [wine_id for _score, wine_id in results] == [1, 3, 2]
+    assert results[0][0] == (1.0, True, True)
+
+
+def test_name_index_search_finds_typos():
+    index = NameIndex()
+    index.add(1, normalize_name("Chateau Montrose"))
+    results = index.search(normalize_name("Chateau Montrse"), min_similarity=0.5)
+    assert [wine_id for _score, wine_id in results] == [1]
+    assert index.search(normalize_name("Pomerol"), min_similarity=0.5) == []
+
+
+@pytest.mark.django_db
+def test_wine_name_key(wine_factory):
+    wine = wine_factory(name="Château Pape Clément")
+    assert wine.name_key == "chateau pape clement"
+    wine.name = "Ch. Haut-Brion"
+    wine.save(update_fields=["name"])
+    wine.refresh_from_db()
+    assert wine.name_key == "chateau haut brion"
+
+
+@pytest.mark.django_db
+def test_find_duplicates(
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks,
+    user,
+    user_factory,
+    wine_factory,
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        wine = wine_factory(name="Château Talbot", vintage=2015, user=user)
+        other = wine_factory(name="Chateau Talbot", vintage=2018, user=user)
+        wine_factory(name="Château Talbot", user=user_factory())
+    assert find_duplicates(user, "Ch. Talbot", 2015) == [wine.pk, other.pk]
+    # the index is kept until a wine of the user changes
+    with django_assert_num_queries(0):
+        assert find_duplicates(user, "Ch. Talbot", 2015) == [wine.pk, other.pk]
+    with django_capture_on_commit_callbacks(execute=True):
+        other.name = "Château Lagrange"
+        other.save()
+    assert find_duplicates(user, "Ch. Talbot", 2015) == [wine.pk]
+    assert find_duplicates(user, "") == []
+
+
+@pytest.mark.django_db
+def test_find_duplicates_sees_vineyard_changes(
+    django_capture_on_commit_callbacks, user, wine_factory, vineyard_factory
+):
+    wine_factory(name="Château Talbot", vintage=2015, user=user)
+    other = wine_factory(name="Château Talbot", vintage=2016, user=user)
+    vineyard = vineyard_factory(user=user)
+    assert find_duplicates(user, "Château Talbot", None, [vineyard.pk])[0] != other.pk
+    with django_capture_on_commit_callbacks(execute=True):
+        other.vineyard.add(vineyard)
+    assert find_duplicates(user, "Château Talbot", None, [vineyard.pk])[0] == other.pk
+
+
+@pytest.mark.django_db
+def test_name_index_is_shared_between_processes(
+    django_assert_num_queries, monkeypatch, user, wine_factory
+):
+    wine = wine_factory(name="Château Talbot", user=user)
+    assert find_duplicates(user, "Château Talbot") == [wine.pk]
+    # another process starts with an empty index cache of its own
+    monkeypatch.setattr(duplicates, "_indexes", LRUCache(1))
+    with django_assert_num_queries(0):
+        assert find_duplicates(user, "Château Talbot") == [wine.pk]
+
+
+@pytest.mark.django_db
+def test_wine_duplicates_view(client, user, wine_factory):
+    wine = wine_factory(name="Château Gruaud Larose", vintage=2010, user=user)
+    wine_factory(name="Riesling Kabinett", user=user)
+    client.force_login(user)
+    response = client.get(
+        reverse("wine-duplicates"), {"name": "chateau gruaud-larose", "vintage": "x"}
+    )
+    assert response.json() == {
+        "wines": [
+            {
+                "id": wine.pk,
+                "name": "Château Gruaud Larose",
+                "vintage": 2010,
+                "url": reverse("wine-detail", kwargs={"pk": wine.pk}),
+            }
+        ]
+    }
@@ -2,7 +2,7 @@ import pytest
 from django.forms import forms
 
 from wine_cellar.apps.wine.fields import OpenMultipleChoiceField
-from wine_cellar.apps.wine.models import Size
+from wine_cellar.apps.wine.models import Grape, Size
 
 
 class CustomTestForm(forms.Form):
@@ -66,3 +66,35 @@ def test_open_multiple_choice_compatible_field_class(size_factory):
     size_factory()
     form = CustomTestFormType(data={"required_field": ["tom_new_opt1"]})
     assert form.is_valid()
+
+
+@pytest.mark.django_db
+def test_open_multiple_choice_creates_new_values_at_once(
+    user, grape_factory, django_assert_num_queries
+):
+    merlot = grape_factory(name="Merlot", user=user)
+    field = OpenMultipleChoiceField(queryset=Grape.objects.all(), field_name="name")
+    field.user = user
+    values = [f"tom_new_opt{name}" for name in ("merlot", "Syrah", "syrah", "Gamay")]
+    # existing values, creating the new ones and the validated queryset
+    with django_assert_num_queries(3):
+        grapes = list(field.clean(values + [str(merlot.pk)]))
+    assert sorted(grape.name for grape in grapes) == ["Gamay", "Merlot", "Syrah"]
+    assert Grape.objects.count() == 3
+    assert all(grape.user == user for grape in grapes)
+
+
+@pytest.mark.django_db
+def test_open_multiple_choice_finds_value_created_concurrently(user, monkeypatch):
+    field = OpenMultipleChoiceField(queryset=Grape.objects.all(), field_name="name")
+    field.user = user
+
+    def bulk_create(objs, ignore_conflicts=False):
+        # another request created the value with another spelling first and
+        # the conflicting new row was dropped
+        Grape.objects.create(name="riesling", user=user)
+        return []
+
+    monkeypatch.setattr(Grape.objects, "bulk_create", bulk_create)
+    grapes = list(field.clean(["tom_new_optRiesling"]))
+    assert [grape.name for grape in grapes] == ["riesling"]
@@ -0,0 +1,256 @@
+import hashlib
+import os
+import threading
+import time
+from http import HTTPStatus
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError
+from django.urls import reverse
+from PIL import Image
+
+from wine_cellar.apps.wine.models import Size, Wine, WineImage
+from wine_cellar.apps.wine.staging import (
+    SESSION_KEY,
+    STAGING_DIR,
+    clean_staged_uploads,
+    get_staged_upload,
+)
+from wine_cellar.apps.wine.storage import content_storage
+from wine_cellar.apps.wine.views import WineCreateView
+
+
+def make_jpeg(color="red"):
+    buffer = BytesIO()
+    Image.new("RGB", (40, 80), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.mark.django_db
+def test_upload_is_stored_by_content_hash(clear_image_folder, client, user):
+    client.force_login(user)
+    content = make_jpeg()
+    data = {
+        "name": "Merlot",
+        "wine_type": "RE",
+        "size": Size.objects.get(name=0.75).pk,
+        "country": "DE",
+        "image_front": SimpleUploadedFile("IMG_0001.JPG", content, "image/jpeg"),
+    }
+    r = client.post(reverse("wine-add"), data, follow=True)
+    assert r.status_code == HTTPStatus.OK
+    image = WineImage.objects.get()
+    content_hash = hashlib.sha256(content).hexdigest()
+    assert image.image.name == f"user_{user.pk}/{content_hash}.jpg"
+
+
+@pytest.mark.django_db
+def test_same_image_is_stored_once(
+    clear_image_folder,
+    django_capture_on_commit_callbacks,
+    user,
+    wine_factory,
+    wine_image_factory,
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        first = wine_image_factory(user=user, wine=wine_factory(user=user))
+        second = wine_image_factory(user=user, wine=wine_factory(user=user))
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert first.image.name == second.image.name
+    assert first.thumbnail.name == second.thumbnail.name
+    assert first.variants == second.variants
+    user_dir = Path(settings.MEDIA_ROOT, f"user_{user.pk}")
+    jpeg_variants = [v for v in first.variants if v["format"] == "jpeg"]
+    jpegs = [p for p in user_dir.iterdir() if p.suffix == ".jpg"]
+    assert len(jpegs) == 1 + 1 + len(jpeg_variants)
+
+    other = wine_image_factory(
+        user=user, image__color="green", wine=wine_factory(user=user)
+    )
+    assert other.image.name != first.image.name
+
+
+@pytest.mark.django_db
+def test_files_deleted_with_last_reference(
+    clear_image_folder,
+    django_capture_on_commit_callbacks,
+    user,
+    wine_factory,
+    wine_image_factory,
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        first = wine_image_factory(user=user, wine=wine_factory(user=user))
+        second = wine_image_factory(user=user, wine=wine_factory(user=user))
+    first.refresh_from_db()
+    paths = [first.image.path, first.thumbnail.path] + [
+        Path(settings.MEDIA_ROOT, v["name"]) for v in first.variants
+    ]
+    with django_capture_on_commit_callbacks(execute=True):
+        first.wine.delete()
+    assert all(Path(p).exists() for p in paths)
+    with django_capture_on_commit_callbacks(execute=True):
+        second.wine.delete()
+    assert not any(Path(p).exists() for p in paths)
+
+
+def test_save_waits_for_deleting_the_same_file(clear_image_folder):
+    name = content_storage.save("user_1/blob.jpg", ContentFile(make_jpeg()))
+    saver = threading.Thread(
+        target=content_storage.save, args=(name, ContentFile(make_jpeg()))
+    )
+
+    def is_used():
+        # a concurrent upload of the same file can't reuse it while it is
+        # being deleted
+        saver.start()
+        saver.join(timeout=0.2)
+        assert saver.is_alive()
+        return False
+
+    assert content_storage.delete_unused(name, is_used)
+    saver.join()
+    assert content_storage.exists(name)
+    assert not content_storage.delete_unused(name, lambda: True)
+    assert content_storage.exists(name)
+
+
+@pytest.mark.django_db
+def test_photos_are_uploaded_once_in_wizard(
+    clear_image_folder, client, django_capture_on_commit_callbacks, user
+):
+    client.force_login(user)
+    content = make_jpeg()
+    data = {
+        "name": "Merlot",
+        "wine_type": "RE",
+        "size": Size.objects.get(name=0.75).pk,
+        "country": "DE",
+        "form_step": 0,
+        "image_front": SimpleUploadedFile("IMG_0001.JPG", content, "image/jpeg"),
+    }
+    r = client.post(reverse("wine-add"), data)
+    assert r.status_code == HTTPStatus.OK
+    form = r.context["form"]
+    token = form["image_front_token"].value()
+    assert form["form_step"].value() == 1
+    assert form.initial["image_front"].name.startswith(f"{STAGING_DIR}/")
+    assert not WineImage.objects.exists()
+
+    # later steps only send the token
+    data.pop("image_front")
+    data.update(form_step=4, image_front_token=token)
+    with django_capture_on_commit_callbacks(execute=True):
+        r = client.post(reverse("wine-add"), data)
+    assert r.status_code == HTTPStatus.FOUND
+    image = WineImage.objects.get()
+    content_hash = hashlib.sha256(content).hexdigest()
+    assert image.image.name == f"user_{user.pk}/{content_hash}.jpg"
+    assert Path(image.image.path).read_bytes() == content
+    assert not list(Path(settings.MEDIA_ROOT, STAGING_DIR).iterdir())
+
+
+@pytest.mark.django_db
+def test_staged_photos_kept_if_saving_fails(
+    clear_image_folder, client, monkeypatch, user
+):
+    client.force_login(user)
+    data = {
+        "name": "Merlot",
+        "wine_type": "RE",
+        "size": Size.objects.get(name=0.75).pk,
+        "country": "DE",
+        "form_step": 0,
+        "image_front": SimpleUploadedFile("IMG_0001.JPG", make_jpeg(), "image/jpeg"),
+    }
+    r = client.post(reverse("wine-add"), data)
+    token = r.context["form"]["image_front_token"].value()
+
+    def fail(user, cleaned_data):
+        raise IntegrityError
+
+    monkeypatch.setattr(WineCreateView, "process_form_data", staticmethod(fail))
+    data.pop("image_front")
+    data.update(form_step=4, image_front_token=token)
+    with pytest.raises(IntegrityError):
+        client.post(reverse("wine-add"), data)
+    assert len(list(Path(settings.MEDIA_ROOT, STAGING_DIR).iterdir())) == 1
+    assert not Path(settings.MEDIA_ROOT, f"user_{user.pk}").exists()
+    assert token in client.session[SESSION_KEY]
+
+
+def test_expired_staged_uploads_are_dropped_from_the_session(rf):
+    request = rf.get("/")
+    request.session = SessionStore()
+    request.session[SESSION_KEY] = {
+        "old": {"name": "staging/old.jpg", "hash": "0", "expires": time.time() - 1},
+        "new": {"name": "staging/new.jpg", "hash": "1", "expires": time.time() + 60},
+    }
+    assert get_staged_upload(request, "old") is None
+    assert list(request.session[SESSION_KEY]) == ["new"]
+
+
+@pytest.mark.django_db
+def test_unknown_staging_token_is_reported(client, user):
+    client.force_login(user)
+    data = {
+        "name": "Merlot",
+        "wine_type": "RE",
+        "size": Size.objects.get(name=0.75).pk,
+        "country": "DE",
+        "image_front_token": "unknown",
+    }
+    r = client.post(reverse("wine-add"), data)
+    assert r.status_code == HTTPStatus.OK
+    assert r.context["form"].errors["image_front"]
+    assert "image_front_token" not in r.context["form"].data
+    assert not Wine.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("cleaned_up", [False, True])
+def test_expired_staged_photo_is_reported(clear_image_folder, client, user, cleaned_up):
+    client.force_login(user)
+    data = {
+        "name": "Merlot",
+        "wine_type": "RE",
+        "size": Size.objects.get(name=0.75).pk,
+        "country": "DE",
+        "form_step": 0,
+        "image_front": SimpleUploadedFile("IMG_0001.JPG", make_jpeg(), "image/jpeg"),
+    }
+    r = client.post(reverse("wine-add"), data)
+    token = r.context["form"]["image_front_token"].value()
+    if cleaned_up:
+        # the cleanup task removed the file before the session entry expired
+        assert clean_staged_uploads(max_age=-1) == 1
+    else:
+        session = client.session
+        session[SESSION_KEY][token]["expires"] = time.time() - 1
+        session.save()
+
+    data.pop("image_front")
+    data.update(form_step=4, image_front_token=token)
+    r = client.post(reverse("wine-add"), data)
+    assert r.status_code == HTTPStatus.OK
+    assert r.context["form"].errors["image_front"] == [
+        "The photo has expired, please add it again."
+    ]
+    assert not Wine.objects.exists()
+
+
+def test_clean_staged_uploads(clear_image_folder):
+    staging = Path(settings.MEDIA_ROOT, STAGING_DIR)
+    staging.mkdir(parents=True)
+    old, recent = staging / "old.jpg", staging / "recent.jpg"
+    old.write_bytes(make_jpeg())
+    recent.write_bytes(make_jpeg())
+    os.utime(old, (time.time() - 7200, time.time() - 7200))
+    assert clean_staged_uploads(max_age=3600) == 1
+    assert list(staging.iterdir()) == [recent]
@@ -0,0 +1,155 @@
+import random
+from http import HTTPStatus
+from io import BytesIO, StringIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from PIL import Image, ImageEnhance
+
+from wine_cellar.apps.wine.label_index import (
+    BKTree,
+    find_wines_by_label,
+    hamming_distance,
+)
+from wine_cellar.apps.wine.models import ImageType, WineImage
+from wine_cellar.apps.wine.utils import LRUCache
+
+LABEL = (-2, -1.5, 1, 1.5)
+OTHER_LABEL = (-1, -0.5, 0.5, 0.5)
+
+
+def make_label(extent=LABEL, size=(400, 600), brightness=1.0, mirror=False):
+    img = Image.effect_mandelbrot(size, extent, 100).convert("RGB")
+    img = ImageEnhance.Brightness(img).enhance(brightness)
+    if mirror:
+        img = img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_lru_cache_drops_least_recently_used():
+    cache = LRUCache(2)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+    assert len(cache) == 2
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.get(3) == "c"
+
+
+def test_bk_tree_search_matches_linear_scan():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) - (1 << 63) for _ in range(2000)]
+    tree = BKTree()
+    for i, value in enumerate(hashes):
+        tree.add(value, i)
+    assert len(tree) == len(hashes)
+    for query in hashes[:20]:
+        for max_distance in (0, 5, 20):
+            expected = {
+                i
+                for i, value in enumerate(hashes)
+                if hamming_distance(query, value) <= max_distance
+            }
+            results = tree.search(query, max_distance)
+            assert {item for _distance, item in results} == expected
+            assert [d for d, _item in results] == sorted(d for d, _item in results)
+
+
+@pytest.mark.django_db
+def test_label_images_are_hashed(
+    clear_image_folder, django_capture_on_commit_callbacks, user, wine_image_factory
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        front = wine_image_factory(
+            user=user, image=ContentFile(make_label(), name="front.jpg")
+        )
+        back = wine_image_factory(
+            user=user,
+            image=ContentFile(make_label(OTHER_LABEL), name="back.jpg"),
+            image_type=ImageType.BACK,
+        )
+    front.refresh_from_db()
+    back.refresh_from_db()
+    assert front.phash is not None
+    assert back.phash is None
+    assert not front.needs_processing
+
+
+@pytest.mark.django_db
+def test_scan_finds_wine_by_label(
+    clear_image_folder,
+    client,
+    django_capture_on_commit_callbacks,
+    user,
+    user_factory,
+    wine_image_factory,
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        image = wine_image_factory(
+            user=user,
+            wine__user=user,
+            image=ContentFile(make_label(), name="front.jpg"),
+        )
+        wine_image_factory(
+            user=user,
+            wine__user=user,
+            image=ContentFile(make_label(OTHER_LABEL), name="other.jpg"),
+            image_type=ImageType.LABEL_FRONT,
+        )
+        # labels of other users are never matched
+        wine_image_factory(
+            user=user_factory(), image=ContentFile(make_label(), name="front.jpg")
+        )
+    client.force_login(user)
+    url = reverse("wine-scan")
+
+    photo = make_label(size=(900, 1300), brightness=0.8)
+    r = client.post(url, {"image": SimpleUploadedFile("photo.jpg", photo)})
+    assert r.status_code == HTTPStatus.FOUND
+    assert r.url == reverse("wine-detail", kwargs={"pk": image.wine.pk})
+
+    photo = make_label(mirror=True)
+    r = client.post(url, {"image": SimpleUploadedFile("photo.jpg", photo)})
+    assert r.status_code == HTTPStatus.OK
+    assert r.context["matches"] == []
+
+
+@pytest.mark.django_db
+def test_label_index_sees_rewritten_hashes(
+    clear_image_folder,
+    django_capture_on_commit_callbacks,
+    tmp_path,
+    user,
+    wine_image_factory,
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        image = wine_image_factory(
+            user=user, image=ContentFile(make_label(), name="front.jpg")
+        )
+        other = wine_image_factory(
+            user=user, image=ContentFile(make_label(OTHER_LABEL), name="other.jpg")
+        )
+    image.refresh_from_db()
+    other.refresh_from_db()
+    # a hash of an older algorithm, rewritten by rebuild_thumbnails
+    WineImage.objects.filter(pk=image.pk).update(phash=other.phash)
+    assert set(find_wines_by_label(user, other.phash, 0)) == {
+        image.wine_id,
+        other.wine_id,
+    }
+
+    call_command(
+        "rebuild_thumbnails",
+        workers=1,
+        checkpoint=tmp_path / "checkpoint",
+        stdout=StringIO(),
+    )
+    assert find_wines_by_label(user, other.phash, 0) == [other.wine_id]
+    assert find_wines_by_label(user, image.phash, 0) == [image.wine_id]
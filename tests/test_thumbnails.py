@@ -0,0 +1,331 @@
+import base64
+import hashlib
+import json
+import re
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import pytest
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.template import Context, Template
+from PIL import ExifTags, Image
+
+from wine_cellar.apps.wine.models import WineImage
+from wine_cellar.apps.wine.tasks import generate_thumbnail
+from wine_cellar.apps.wine.templatetags.react_maps_tags import wine_to_json
+from wine_cellar.apps.wine.utils import ingest_image, open_image
+
+
+@pytest.mark.django_db
+def test_thumbnail_generated_after_commit(
+    clear_image_folder,
+    django_capture_on_commit_callbacks,
+    user,
+    wine_factory,
+    wine_image_factory,
+):
+    wine = wine_factory(user=user)
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        wine_image = wine_image_factory(user=user, wine=wine)
+    wine_image.refresh_from_db()
+    assert not wine_image.thumbnail
+    assert len(callbacks) == 1
+    callbacks[0]()
+    wine_image.refresh_from_db()
+    base = wine_image.image.name.removesuffix(".jpg")
+    assert re.fullmatch(
+        rf"{base}_thumb\.[0-9a-f]{{12}}\.jpg", wine_image.thumbnail.name
+    )
+
+
+@pytest.mark.django_db
+def test_generate_thumbnail_is_idempotent(
+    clear_image_folder, django_capture_on_commit_callbacks, user, wine_image_factory
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        wine_image = wine_image_factory(user=user)
+    wine_image.refresh_from_db()
+    thumbnail = wine_image.thumbnail.name
+    generate_thumbnail(wine_image.pk)
+    wine_image.refresh_from_db()
+    assert wine_image.thumbnail.name == thumbnail
+
+
+@pytest.mark.django_db
+def test_generate_thumbnail_skips_deleted_image():
+    generate_thumbnail(1234)
+    assert WineImage.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_wine_falls_back_to_image_without_thumbnail(
+    clear_image_folder, user, wine_factory, wine_image_factory
+):
+    wine = wine_factory(user=user)
+    wine_image = wine_image_factory(user=user, wine=wine)
+    assert not wine_image.thumbnail
+    assert wine.image_thumbnail == wine_image.image.url
+    assert wine.image_thumbnails == [
+        {
+            "src": wine_image.image.url,
+            "srcset": "",
+            "webp_srcset": "",
+            "aspect": None,
+            "placeholder": "",
+        }
+    ]
+
+
+@pytest.mark.django_db
+def test_generate_thumbnail_creates_variants(
+    clear_image_folder, django_capture_on_commit_callbacks, user, wine_image_factory
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        wine_image = wine_image_factory(user=user, image__width=800, image__height=1200)
+    wine_image.refresh_from_db()
+    widths = [v["width"] for v in wine_image.variants if v["format"] == "webp"]
+    # variants are never upscaled beyond the original width
+    assert widths == [160, 320, 640, 800]
+    assert {v["format"] for v in wine_image.variants} == {"webp", "jpeg"}
+    assert wine_image.variants[0]["height"] == 240
+    for variant in wine_image.variants:
+        assert Path(settings.MEDIA_ROOT, variant["name"]).exists()
+    base = wine_image.image.name.removesuffix(".jpg")
+    assert re.match(
+        rf"/media/{base}_160w\.[0-9a-f]{{12}}\.webp 160w, ", wine_image.webp_srcset
+    )
+    assert re.search(
+        rf"/media/{base}_800w\.[0-9a-f]{{12}}\.jpg 800w$", wine_image.srcset
+    )
+    assert wine_image.wine.image == wine_image.srcset.split(", ")[-1].split(" ")[0]
+
+
+@pytest.mark.django_db
+def test_wine_picture_tag(
+    clear_image_folder, django_capture_on_commit_callbacks, user, wine_image_factory
+):
+    template = Template("{% load wine_images %}{% wine_picture image 200 alt='x' %}")
+    with django_capture_on_commit_callbacks(execute=True):
+        wine_image = wine_image_factory(user=user, image__width=400, image__height=800)
+    wine_image.refresh_from_db()
+    html = template.render(Context({"image": wine_image}))
+    assert '<source type="image/webp"' in html
+    assert 'sizes="100px"' in html
+    assert 'width="100"' in html
+    assert f"url({wine_image.placeholder})" in html
+    assert f'src="{wine_image.thumbnail.url}"' in html
+    html = template.render(Context({"image": None}))
+    assert html.startswith('<img alt="x" height="200" src="/static/images/bottle.svg"')
+
+
+def test_open_image_rotates_and_decodes_reduced(tmp_path):
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6
+    path = tmp_path / "rotated.jpg"
+    Image.new("RGB", (400, 200)).save(path, format="JPEG", exif=exif)
+    assert open_image(path).size == (200, 400)
+    # draft mode decodes at 1/4 scale which still covers the requested size
+    assert open_image(path, (50, 100)).size == (50, 100)
+    assert open_image(path, (60, 100)).size == (100, 200)
+
+
+def test_benchmark_thumbnails_command():
+    out = StringIO()
+    call_command("benchmark_thumbnails", count=1, width=320, height=240, stdout=out)
+    output = out.getvalue()
+    assert "legacy:" in output
+    assert "fast:" in output
+    assert "ms/image" in output
+
+
+@pytest.mark.django_db
+def test_rebuild_thumbnails_command(
+    clear_image_folder, tmp_path, user, user_factory, wine_image_factory
+):
+    images = [wine_image_factory(user=user) for _ in range(3)]
+    other_image = wine_image_factory(user=user_factory())
+    checkpoint = tmp_path / "checkpoint"
+    out = StringIO()
+    call_command(
+        "rebuild_thumbnails",
+        user=user.username,
+        workers=1,
+        chunk_size=2,
+        checkpoint=checkpoint,
+        stdout=out,
+    )
+    assert "2/3 images" in out.getvalue()
+    assert "Rebuilt 3 images" in out.getvalue()
+    assert not checkpoint.exists()
+    for image in images:
+        image.refresh_from_db()
+        assert image.thumbnail
+        assert image.variants
+    other_image.refresh_from_db()
+    assert not other_image.thumbnail
+
+
+@pytest.mark.django_db
+def test_rebuild_thumbnails_command_resumes(
+    clear_image_folder, tmp_path, user, wine_image_factory
+):
+    first, second = wine_image_factory(user=user), wine_image_factory(user=user)
+    checkpoint = tmp_path / "checkpoint"
+    checkpoint.write_text(
+        json.dumps({"filters": {"user": None, "missing": True}, "last_pk": first.pk})
+    )
+    call_command(
+        "rebuild_thumbnails",
+        missing=True,
+        workers=2,
+        checkpoint=checkpoint,
+        stdout=StringIO(),
+    )
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert not first.thumbnail
+    assert second.thumbnail
+    assert second.variants
+
+    checkpoint.write_text(
+        json.dumps({"filters": {"user": None, "missing": False}, "last_pk": 1})
+    )
+    with pytest.raises(CommandError):
+        call_command("rebuild_thumbnails", missing=True, checkpoint=checkpoint)
+
+
+@pytest.mark.django_db
+def test_ingest_image_downscales_and_strips_metadata(
+    clear_image_folder, settings, user, wine_image_factory
+):
+    settings.WINE_IMAGE_MAX_EDGE = 500
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6
+    buffer = BytesIO()
+    Image.new("RGB", (1200, 800), "red").save(buffer, format="JPEG", exif=exif)
+    wine_image = wine_image_factory(
+        user=user, image=ContentFile(buffer.getvalue(), name="photo.jpg")
+    )
+    original = wine_image.image.name
+    assert ingest_image(wine_image)
+    with Image.open(wine_image.image.path) as img:
+        assert img.size == (333, 500)
+        assert not img.getexif()
+    # the normalized file is named after its own content
+    content_hash = hashlib.sha256(Path(wine_image.image.path).read_bytes())
+    assert wine_image.image.name == f"user_{user.pk}/{content_hash.hexdigest()}.jpg"
+    assert wine_image.image.name != original
+    # already ingested images are not rewritten
+    assert not ingest_image(wine_image)
+
+
+@pytest.mark.django_db
+def test_generate_thumbnail_renames_ingested_original(
+    clear_image_folder,
+    django_capture_on_commit_callbacks,
+    settings,
+    user,
+    wine_factory,
+    wine_image_factory,
+):
+    settings.WINE_IMAGE_MAX_EDGE = 50
+    with django_capture_on_commit_callbacks(execute=True):
+        first = wine_image_factory(user=user, wine=wine_factory(user=user))
+        second = wine_image_factory(user=user, wine=wine_factory(user=user))
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert first.image.name == second.image.name
+    content_hash = hashlib.sha256(Path(first.image.path).read_bytes()).hexdigest()
+    assert first.image.name == f"user_{user.pk}/{content_hash}.jpg"
+    # the original upload is removed
+    user_dir = Path(settings.MEDIA_ROOT, f"user_{user.pk}")
+    originals = [
+        p for p in user_dir.iterdir() if re.fullmatch(r"[0-9a-f]{64}\.jpg", p.name)
+    ]
+    assert originals == [Path(first.image.path)]
+
+
+@pytest.mark.django_db
+def test_changed_images_get_new_urls(
+    clear_image_folder,
+    django_capture_on_commit_callbacks,
+    settings,
+    user,
+    wine_image_factory,
+):
+    settings.WINE_IMAGE_MAX_EDGE = 300
+    wine_image = wine_image_factory(user=user, image__width=400)
+    other_image = wine_image_factory(user=user, image__width=401)
+    assert wine_image.image.url != other_image.image.url
+    # ingesting changes the bytes of the original and with them its URL
+    uploaded_url = wine_image.image.url
+    generate_thumbnail(wine_image.pk)
+    wine_image.refresh_from_db()
+    assert wine_image.image.url != uploaded_url
+
+    old_thumbnail, old_variants = wine_image.thumbnail.name, wine_image.variants
+    settings.WINE_IMAGE_QUALITY = 30
+    call_command("rebuild_thumbnails", workers=1, stdout=StringIO())
+    wine_image.refresh_from_db()
+    assert wine_image.thumbnail.name != old_thumbnail
+    assert wine_image.srcset != ""
+    assert not {v["name"] for v in wine_image.variants} & {
+        v["name"] for v in old_variants
+    }
+    # replaced files are removed once no image uses them anymore
+    assert not Path(settings.MEDIA_ROOT, old_thumbnail).exists()
+    assert Path(wine_image.thumbnail.path).exists()
+
+    caddyfile = (settings.ROOT_DIR / "caddy" / "Caddyfile").read_text()
+    immutable = re.search(r"@immutable path_regexp (\S+)", caddyfile).group(1)
+    urls = [wine_image.thumbnail.url]
+    urls += [f"/media/{v['name']}" for v in wine_image.variants]
+    for url in urls:
+        assert re.match(immutable, url)
+    assert not re.match(immutable, "/media/user_1/example_thumb.jpg")
+    # originals are not versioned
+    assert not re.match(immutable, wine_image.image.url)
+
+
+@pytest.mark.django_db
+def test_generate_thumbnail_creates_placeholder(
+    clear_image_folder, django_capture_on_commit_callbacks, user, wine_image_factory
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        wine_image = wine_image_factory(user=user, image__width=400, image__height=800)
+    wine_image.refresh_from_db()
+    assert wine_image.placeholder.startswith("data:image/webp;base64,")
+    assert len(wine_image.placeholder) < 1000
+    data = base64.b64decode(wine_image.placeholder.split(",", 1)[1])
+    with Image.open(BytesIO(data)) as img:
+        assert img.size == (16, 32)
+    assert wine_to_json(wine_image.wine)["image_placeholder"] == wine_image.placeholder
+
+
+@pytest.mark.django_db
+def test_rebuild_deletes_replaced_variants(
+    clear_image_folder,
+    django_capture_on_commit_callbacks,
+    settings,
+    user,
+    wine_image_factory,
+):
+    settings.WINE_IMAGE_VARIANT_WIDTHS = [40, 80]
+    with django_capture_on_commit_callbacks(execute=True):
+        wine_image = wine_image_factory(user=user, image__width=400)
+    wine_image.refresh_from_db()
+    old_thumbnail, old_variants = wine_image.thumbnail.name, wine_image.variants
+
+    settings.WINE_IMAGE_VARIANT_WIDTHS = [40, 160]
+    call_command("rebuild_thumbnails", workers=1, stdout=StringIO())
+    wine_image.refresh_from_db()
+    # only the variants changed
+    assert wine_image.thumbnail.name == old_thumbnail
+    names = {v["name"] for v in wine_image.variants}
+    for variant in old_variants:
+        path = Path(settings.MEDIA_ROOT, variant["name"])
+        assert path.exists() == (variant["name"] in names)
+    assert {v["width"] for v in old_variants if v["name"] not in names} == {80}
+    assert all(Path(settings.MEDIA_ROOT, name).exists() for name in names)
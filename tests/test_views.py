@@ -2,6 +2,8 @@ import datetime
 from http import HTTPStatus
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from pytest_django.asserts import (
     assertRedirects,
@@ -9,7 +11,7 @@ from pytest_django.asserts import (
     assertTemplateUsed,
 )
 
-from wine_cellar.apps.wine.models import Size, Wine
+from wine_cellar.apps.wine.models import ImageType, Size, Wine
 
 
 @pytest.mark.django_db
@@ -738,3 +740,94 @@ def test_wine_filter_price(client, user, wine_factory, storage_item_factory):
         wine_in_stock_middle,
         wine_in_stock_expensive,
     ]
+
+
+@pytest.mark.django_db
+def test_wine_update_unchanged_saves_nothing(
+    clear_image_folder,
+    django_capture_on_commit_callbacks,
+    client,
+    user,
+    wine_factory,
+    grape_factory,
+    wine_image_factory,
+):
+    grape = grape_factory(user=user)
+    size = Size.objects.get(name=0.75)
+    wine = wine_factory(
+        user=user, country="DE", category="DR", size=size, grapes=[grape]
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        wine_image_factory(wine=wine, user=user)
+    client.force_login(user)
+    form = client.get(reverse("wine-edit", kwargs={"pk": wine.pk})).context["form"]
+    data = {
+        name: form[name].value()
+        for name in form.fields
+        if form[name].value() is not None and not name.startswith("image_")
+    }
+    data["size"] = wine.size_id
+    modified = wine.modified
+    with CaptureQueriesContext(connection) as queries:
+        r = client.post(reverse("wine-edit", kwargs={"pk": wine.pk}), data)
+    assert r.status_code == HTTPStatus.FOUND
+    writes = [
+        q["sql"]
+        for q in queries
+        if q["sql"].startswith(("UPDATE", "INSERT", "DELETE"))
+        and "django_session" not in q["sql"]
+    ]
+    assert writes == []
+    wine.refresh_from_db()
+    assert wine.modified == modified
+    assert list(wine.grapes.all()) == [grape]
+    assert wine.wineimage_set.count() == 1
+
+
+@pytest.mark.django_db
+def test_wine_update_relations_only_bumps_modified(
+    client, user, wine_factory, grape_factory
+):
+    grape = grape_factory(user=user)
+    other = grape_factory(user=user)
+    size = Size.objects.get(name=0.75)
+    wine = wine_factory(
+        user=user, country="DE", category="DR", size=size, grapes=[grape]
+    )
+    client.force_login(user)
+    form = client.get(reverse("wine-edit", kwargs={"pk": wine.pk})).context["form"]
+    data = {
+        name: form[name].value()
+        for name in form.fields
+        if form[name].value() is not None and not name.startswith("image_")
+    }
+    data["size"] = wine.size_id
+    data["grapes"] = [other.pk]
+    modified = wine.modified
+    r = client.post(reverse("wine-edit", kwargs={"pk": wine.pk}), data)
+    assert r.status_code == HTTPStatus.FOUND
+    wine.refresh_from_db()
+    assert wine.modified > modified
+    assert list(wine.grapes.all()) == [other]
+
+
+@pytest.mark.django_db
+def test_wine_edit_form_loads_images_at_once(
+    clear_image_folder, client, user, wine_factory, wine_image_factory
+):
+    wine = wine_factory(user=user)
+    # thumbnails are only generated after the commit
+    front = wine_image_factory(wine=wine, user=user, image_type=ImageType.FRONT)
+    wine_image_factory(wine=wine, user=user, image_type=ImageType.BACK)
+    client.force_login(user)
+    with CaptureQueriesContext(connection) as queries:
+        r = client.get(reverse("wine-edit", kwargs={"pk": wine.pk}))
+    assert r.status_code == HTTPStatus.OK
+    image_queries = [q for q in queries if 'FROM "wine_wineimage"' in q["sql"]]
+    assert len(image_queries) == 1
+    form = r.context["form"]
+    assert form.initial["image_front"] == front.image
+    assert form.fields["image_front"].widget.attrs["data-existing-url"] == (
+        front.image.url
+    )
+    assert "image_front_label" not in form.initial
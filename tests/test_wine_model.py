@@ -1,11 +1,15 @@
+import hashlib
+from datetime import timedelta
 from decimal import Decimal
 from pathlib import Path
 
 import pytest
 from django.conf import settings
 from django.templatetags.static import static
+from django.utils import timezone
 from django.utils.formats import number_format
 
+from wine_cellar.apps.storage.tasks import archive_storage_items
 from wine_cellar.apps.user.models import UserSettings
 
 
@@ -37,8 +41,11 @@ def test_wine_image(clear_image_folder, user, wine_factory, wine_image_factory):
     wine = wine_factory(user=user)
     wine_image = wine_image_factory(user=user, wine=wine)
     assert wine.image == wine_image.image.url
+    wine_image.image.open()
+    content_hash = hashlib.sha256(wine_image.image.read()).hexdigest()
+    wine_image.image.close()
     assert wine_image.image.path == str(
-        settings.MEDIA_ROOT / Path("user_" + str(user.pk) + "/example.jpg")
+        settings.MEDIA_ROOT / Path("user_" + str(user.pk) + f"/{content_hash}.jpg")
     )
 
 
@@ -96,3 +103,23 @@ def test_get_average_respects_user_currency(user, wine_factory, storage_item_fac
     currency = settings.CURRENCY_SYMBOLS.get(us.currency)
     expected = f"{number_format(avg, use_l10n=True)}{currency}"
     assert wine.get_average_price_with_currency == expected
+
+
+@pytest.mark.django_db
+def test_average_price_includes_archived_items(
+    user, wine_factory, storage_item_factory
+):
+    wine = wine_factory(user=user)
+    storage_item_factory(wine=wine, price=10.00)
+    storage_item_factory(
+        wine=wine,
+        price=25.00,
+        deleted=True,
+        consumed_at=timezone.now() - timedelta(days=400),
+    )
+    expected = wine.get_average_price_with_currency
+    assert expected.startswith(number_format(Decimal("17.50"), use_l10n=True))
+
+    assert archive_storage_items() == 1
+    assert wine.storageitem_set.count() == 1
+    assert wine.get_average_price_with_currency == expected
@@ -55,3 +55,22 @@ def test_user_signup_enabled(client, user):
     assert r.status_code == HTTPStatus.OK
     assertTemplateUsed(response=r, template_name="base.html")
     assertTemplateUsed(response=r, template_name="account/signup.html")
+
+
+@pytest.mark.django_db
+def test_user_settings_reminder_days(client, user):
+    client.force_login(user)
+    data = {"language": "en-gb", "currency": "EUR", "reminder_days": "14, 3,14"}
+    r = client.post(reverse("user-settings"), data)
+    assertRedirects(response=r, expected_url=reverse("user-settings"))
+    user.user_settings.refresh_from_db()
+    assert user.user_settings.reminder_days == "3,14"
+    assert user.user_settings.reminder_horizons == [3, 14]
+
+    for reminder_days in ("14, -3", "0", "9999999", "14,x"):
+        data["reminder_days"] = reminder_days
+        r = client.post(reverse("user-settings"), data)
+        assert r.status_code == HTTPStatus.OK
+        assert "reminder_days" in r.context["form"].errors
+    user.user_settings.refresh_from_db()
+    assert user.user_settings.reminder_days == "3,14"
@@ -27,6 +27,12 @@ module.exports = {
     stock_add: {
       import: ['./wine_cellar/assets/js/stock_add.ts'],
     },
+    storage_grid: {
+      import: ['./wine_cellar/assets/js/storage_grid.ts'],
+    },
+    wine_duplicates: {
+      import: ['./wine_cellar/assets/js/wine_duplicates.ts'],
+    },
     barcode_scanner: {
       import: ['./wine_cellar/react/react_bar_code.tsx'],
     },
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from wine_cellar.apps.storage.models import Storage, StorageItem
+from wine_cellar.apps.storage.models import ArchivedStorageItem, Storage, StorageItem
 
 
 @admin.register(Storage)
@@ -15,3 +15,10 @@ class StorageItemAdmin(admin.ModelAdmin):
     list_display = ("id", "storage", "wine", "row", "column", "created")
     search_fields = ("wine__name", "storage__name")
     list_filter = ("storage",)
+
+
+@admin.register(ArchivedStorageItem)
+class ArchivedStorageItemAdmin(admin.ModelAdmin):
+    list_display = ("id", "storage", "wine", "row", "column", "modified")
+    search_fields = ("wine__name", "storage__name")
+    list_filter = ("storage",)
@@ -0,0 +1,203 @@
+from django.db import IntegrityError, transaction
+from django.utils.translation import gettext as _
+from django.utils.translation import ngettext
+
+from wine_cellar.apps.storage.models import Storage, StorageItem
+from wine_cellar.apps.storage.occupancy import invalidate_occupancy
+
+
+class SlotUnavailable(Exception):
+    """The requested slot is occupied or the storage has too few free slots."""
+
+
+def slot_occupied(row, column):
+    return SlotUnavailable(
+        _(
+            "The selected slot (row: %(row)s, column: %(column)s)"
+            " is already occupied in the storage."
+        )
+        % {"row": row, "column": column}
+    )
+
+
+def not_enough_slots(free):
+    return SlotUnavailable(
+        ngettext(
+            "The storage has only %(free)s free slot.",
+            "The storage has only %(free)s free slots.",
+            free,
+        )
+        % {"free": free}
+    )
+
+
+def has_slots(storage):
+    return storage.rows > 0 and storage.columns > 0
+
+
+def find_free_slots(storage, occupied, count=1, hint=None):
+    """
+    Return up to count free (row, column) slots of a storage in row-major
+    order, or the free slots closest to the (row, column) hint.
+    """
+    free = [
+        (row, column)
+        for row in range(1, storage.rows + 1)
+        for column in range(1, storage.columns + 1)
+        if (row, column) not in occupied
+    ]
+    if hint is not None:
+        free.sort(
+            key=lambda slot: ((slot[0] - hint[0]) ** 2 + (slot[1] - hint[1]) ** 2)
+        )
+    return free[:count]
+
+
+def _allocate(storage, wine, user, quantity, row, column, hint, price):
+    # serializes allocations per storage on databases with row locks
+    storage = Storage.objects.select_for_update().get(pk=storage.pk)
+    if not has_slots(storage):
+        slots = [(None, None)] * quantity
+    else:
+        occupied = set(storage.items.filter(deleted=False).values_list("row", "column"))
+        slots = []
+        if row and column:
+            if (row, column) in occupied:
+                raise slot_occupied(row, column)
+            slots.append((row, column))
+            occupied.add((row, column))
+            hint = (row, column)
+        slots += find_free_slots(storage, occupied, quantity - len(slots), hint)
+        if len(slots) < quantity:
+            free = storage.total_slots - len(occupied) + bool(row and column)
+            raise not_enough_slots(free)
+    items = StorageItem.objects.bulk_create(
+        StorageItem(
+            storage=storage,
+            wine=wine,
+            row=slot_row,
+            column=slot_column,
+            user=user,
+            price=price,
+        )
+        for slot_row, slot_column in slots
+    )
+    # bulk_create doesn't send post_save
+    transaction.on_commit(lambda: invalidate_occupancy(storage.user_id))
+    return items
+
+
+def allocate_slots(
+    storage,
+    wine,
+    user,
+    quantity=1,
+    row=None,
+    column=None,
+    hint=None,
+    price=None,
+    attempts=3,
+):
+    """
+    Store quantity bottles of a wine in a storage in one transaction and
+    return the new StorageItems.
+
+    If row and column are given the first bottle is put into that slot and
+    the others into the free slots closest to it. Otherwise the next free
+    slots are used, see find_free_slots. Raises SlotUnavailable if the slot
+    is taken or the storage has too few free slots. Concurrent allocations
+    which still collide are rejected by the unique constraint on live slots,
+    automatically picked slots are then chosen again.
+    """
+    for _attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                return _allocate(
+                    storage, wine, user, quantity, row, column, hint, price
+                )
+        except IntegrityError:
+            if row and column and quantity == 1:
+                raise slot_occupied(row, column)
+    raise SlotUnavailable(_("The slots were taken in the meantime, try again."))
+
+
+def allocate_slot(storage, wine, user, row=None, column=None, hint=None, price=None):
+    """Store a single bottle, see allocate_slots."""
+    return allocate_slots(
+        storage, wine, user, row=row, column=column, hint=hint, price=price
+    )[0]
+
+
+def _move(items, storage, slots, row, column, hint):
+    # lock the target and the source storages in a fixed order
+    storage_pks = {storage.pk, *(item.storage_id for item in items)}
+    storages = {
+        locked.pk: locked
+        for locked in Storage.objects.select_for_update()
+        .filter(pk__in=storage_pks)
+        .order_by("pk")
+    }
+    storage = storages[storage.pk]
+    if not has_slots(storage):
+        slots = [(None, None)] * len(items)
+    else:
+        # the moved bottles free their current slots
+        occupied = set(
+            storage.items.filter(deleted=False)
+            .exclude(pk__in=[item.pk for item in items])
+            .values_list("row", "column")
+        )
+        if slots is None:
+            slots = []
+            if row and column:
+                slots.append((row, column))
+                hint = (row, column)
+        else:
+            slots = list(slots)
+        for slot in slots:
+            if not (1 <= slot[0] <= storage.rows and 1 <= slot[1] <= storage.columns):
+                raise SlotUnavailable(
+                    _("The slot (row: %(row)s, column: %(column)s) doesn't exist.")
+                    % {"row": slot[0], "column": slot[1]}
+                )
+            if slot in occupied:
+                raise slot_occupied(*slot)
+            occupied.add(slot)
+        free = storage.total_slots - len(occupied) + len(slots)
+        slots += find_free_slots(storage, occupied, len(items) - len(slots), hint)
+        if len(slots) < len(items):
+            raise not_enough_slots(free)
+    moved = [item for item in items if item.storage_id == storage.pk]
+    if moved and has_slots(storage):
+        # free the slots first so bottles can swap places within a storage
+        StorageItem.objects.filter(pk__in=[item.pk for item in moved]).update(
+            row=None, column=None
+        )
+    for item, (slot_row, slot_column) in zip(items, slots):
+        item.storage = storage
+        item.row = slot_row
+        item.column = slot_column
+    StorageItem.objects.bulk_update(items, ["storage", "row", "column"])
+    # bulk_update doesn't send post_save
+    transaction.on_commit(lambda: invalidate_occupancy(storage.user_id))
+    return items
+
+
+def move_items(items, storage, slots=None, row=None, column=None, hint=None):
+    """
+    Move live StorageItems into a storage in one transaction, keeping the
+    items themselves and their price, and return them.
+
+    slots gives the target (row, column) of every item in order. Otherwise
+    the first item is put into the slot at row and column if given and the
+    others into the free slots closest to it, or into the next free slots.
+    All targets are validated before anything is changed, raises
+    SlotUnavailable if one of them is taken or the storage is too small.
+    """
+    if slots is not None and len(slots) != len(items):
+        raise ValueError("Expected one slot per item.")
+    try:
+        with transaction.atomic():
+            return _move(list(items), storage, slots, row, column, hint)
+    except IntegrityError:
+        raise SlotUnavailable(_("The slots were taken in the meantime, try again."))
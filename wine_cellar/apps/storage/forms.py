@@ -1,8 +1,9 @@
 from django import forms
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils.translation import gettext_lazy as _
 
-from wine_cellar.apps.storage.models import Storage
+from wine_cellar.apps.storage.models import Storage, StorageItem
 from wine_cellar.apps.user.views import get_user_settings
 
 
@@ -31,6 +32,34 @@ class StorageForm(forms.Form):
     )
 
 
+class StorageItemFilterForm(forms.Form):
+    row_from = forms.IntegerField(required=False, min_value=1, label=_("From row"))
+    row_to = forms.IntegerField(required=False, min_value=1, label=_("To row"))
+    after = forms.RegexField(
+        required=False, regex=r"^(\d+\.\d+\.)?\d+$", widget=forms.HiddenInput
+    )
+
+    def clean_after(self):
+        """(pk,) after an item without a slot, else (row, column, pk)."""
+        after = self.cleaned_data.get("after")
+        if not after:
+            return None
+        return tuple(int(key) for key in after.split("."))
+
+
+class StockConsumeForm(forms.Form):
+    tasting_note = forms.CharField(
+        required=False,
+        widget=forms.Textarea,
+        help_text=_("Note how the wine tasted, or leave empty."),
+    )
+    rating = forms.IntegerField(
+        required=False,
+        validators=[MinValueValidator(0), MaxValueValidator(10)],
+        help_text=_("Rate this bottle on a scale from 0 to 10."),
+    )
+
+
 class StockAddForm(forms.Form):
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop("user")
@@ -62,6 +91,21 @@ class StockAddForm(forms.Form):
         help_text=_("Enter the number of columns in the storage."),
         widget=forms.Select(),
     )
+    quantity = forms.IntegerField(
+        required=False,
+        initial=1,
+        min_value=1,
+        max_value=100,
+        help_text=_(
+            "Enter the number of bottles, additional bottles are put into the"
+            " free slots closest to the selected one."
+        ),
+    )
+    auto_place = forms.BooleanField(
+        required=False,
+        label=_("Place automatically"),
+        help_text=_("Put the bottles into the next free slots of the storage."),
+    )
     price = forms.DecimalField(
         required=False,
         max_digits=6,
@@ -107,7 +151,7 @@ class StockAddForm(forms.Form):
         row = cleaned_data.get("row")
         column = cleaned_data.get("column")
         storage = cleaned_data.get("storage")
-        if storage:
+        if storage and not cleaned_data.get("auto_place"):
             if storage.rows > 0 and storage.columns > 0:
                 if not row or not column:
                     raise forms.ValidationError(
@@ -127,3 +171,52 @@ class StockAddForm(forms.Form):
                         params={"row": row, "column": column},
                     )
         return cleaned_data
+
+
+class StockMoveForm(forms.Form):
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop("user")
+        super().__init__(*args, **kwargs)
+        self.fields["items"].queryset = StorageItem.objects.filter(
+            user=self.user, deleted=False
+        ).select_related("wine", "storage")
+        self.fields["storage"].queryset = Storage.objects.filter(user=self.user)
+
+    items = forms.ModelMultipleChoiceField(
+        queryset=StorageItem.objects.none(), widget=forms.MultipleHiddenInput
+    )
+    storage = forms.ModelChoiceField(
+        queryset=Storage.objects.none(),
+        help_text=_("Enter the name of the storage to move the bottles to."),
+    )
+    row = forms.IntegerField(
+        required=False,
+        min_value=1,
+        help_text=_("Enter the row of the first bottle, or leave empty."),
+    )
+    column = forms.IntegerField(
+        required=False,
+        min_value=1,
+        help_text=_(
+            "Enter the column of the first bottle, the others are put into the"
+            " free slots closest to it."
+        ),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        row = cleaned_data.get("row")
+        column = cleaned_data.get("column")
+        storage = cleaned_data.get("storage")
+        if storage and (row or column):
+            if not row or not column:
+                raise forms.ValidationError(
+                    _("Both row and column must be specified for the selected slot."),
+                    code="row_column_required",
+                )
+            if row > storage.rows or column > storage.columns:
+                raise forms.ValidationError(
+                    _("The selected slot doesn't exist in the storage."),
+                    code="slot_exceeds",
+                )
+        return cleaned_data
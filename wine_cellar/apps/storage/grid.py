@@ -0,0 +1,104 @@
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.text import Truncator
+
+from wine_cellar.apps.storage.occupancy import storage_version
+from wine_cellar.apps.wine.models import ImageType, WineImage
+
+GRID_CACHE_KEY = "storage-grid:{storage_id}:{version}"
+LABEL_LENGTH = 30
+
+
+def run_length_encode(values):
+    """Encode a list as flat pairs of value and count, [0, 0, 2] -> [0, 2, 2, 1]."""
+    encoded = []
+    for value in values:
+        if encoded and encoded[-2] == value:
+            encoded[-1] += 1
+        else:
+            encoded += [value, 1]
+    return encoded
+
+
+def build_grid(storage):
+    """
+    Build the occupancy grid of a storage from a single query.
+
+    wines lists each stored wine once. cells covers all slots row by row and
+    is run-length encoded, see run_length_encode, where a value is the
+    1-based index of the wine in wines or 0 for a free slot. Items without
+    a slot are counted in unplaced.
+    """
+    items = (
+        storage.items.filter(deleted=False)
+        .values_list("row", "column", "wine_id", "wine__name", "wine__vintage")
+        .order_by("pk")
+    )
+    wines = []
+    wine_indexes = {}
+    cells = [0] * (storage.rows * storage.columns)
+    unplaced = 0
+    for row, column, wine_id, name, vintage in items:
+        if wine_id not in wine_indexes:
+            label = f"{name} {vintage}" if vintage else name
+            wines.append(
+                {
+                    "id": wine_id,
+                    "label": Truncator(label).chars(LABEL_LENGTH),
+                    "url": reverse("wine-detail", kwargs={"pk": wine_id}),
+                }
+            )
+            wine_indexes[wine_id] = len(wines)
+        if row and column and row <= storage.rows and column <= storage.columns:
+            cells[(row - 1) * storage.columns + column - 1] = wine_indexes[wine_id]
+        else:
+            unplaced += 1
+    return {
+        "rows": storage.rows,
+        "columns": storage.columns,
+        "wines": wines,
+        "cells": run_length_encode(cells),
+        "unplaced": unplaced,
+    }
+
+
+def get_front_images(storage):
+    """Return wine id -> (image id, thumbnail) of the wines in a storage."""
+    images = (
+        WineImage.objects.filter(
+            image_type=ImageType.FRONT,
+            wine__in=storage.items.filter(deleted=False).values("wine"),
+        )
+        .order_by("-pk")
+        .values_list("wine_id", "pk", "thumbnail")
+    )
+    # the first front image of a wine wins, like Wine.front_image
+    return {wine_id: (pk, thumbnail) for wine_id, pk, thumbnail in images}
+
+
+def get_grid(storage):
+    """
+    Return the grid of a storage. The slots are cached until its storages
+    change, the front images are read on every call because thumbnails are
+    generated and replaced without changing the storage version.
+    """
+    key = GRID_CACHE_KEY.format(
+        storage_id=storage.pk, version=storage_version(storage.user_id)
+    )
+    grid = cache.get(key)
+    if grid is None:
+        grid = build_grid(storage)
+        cache.set(key, grid)
+    images = get_front_images(storage)
+    wines = []
+    for wine in grid["wines"]:
+        image_id, thumbnail = images.get(wine["id"], (None, None))
+        wines.append(
+            {
+                **wine,
+                "image": image_id,
+                "thumbnail": default_storage.url(thumbnail) if thumbnail else None,
+            }
+        )
+    return {**grid, "wines": wines}
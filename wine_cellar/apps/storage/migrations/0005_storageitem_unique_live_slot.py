@@ -0,0 +1,46 @@
+# Generated by Django 5.2.9 on 2026-10-19 16:40
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def unplace_duplicates(apps, schema_editor):
+    """
+    Items which share a slot with an older item lose their slot, they stay
+    in the storage but without row and column.
+    """
+    StorageItem = apps.get_model("storage", "StorageItem")
+    live = StorageItem.objects.filter(
+        deleted=False, row__isnull=False, column__isnull=False
+    )
+    duplicates = (
+        live.values("storage", "row", "column")
+        .annotate(count=Count("pk"))
+        .filter(count__gt=1)
+    )
+    for slot in duplicates:
+        items = live.filter(
+            storage=slot["storage"], row=slot["row"], column=slot["column"]
+        ).order_by("created", "pk")
+        StorageItem.objects.filter(
+            pk__in=list(items.values_list("pk", flat=True)[1:])
+        ).update(row=None, column=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0004_storageitem_price"),
+    ]
+
+    operations = [
+        migrations.RunPython(unplace_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="storageitem",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("deleted", False)),
+                fields=("storage", "row", "column"),
+                name="unique live slot",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0005_storageitem_unique_live_slot"),
+        ("wine", "0019_wineimage_placeholder"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedStorageItem",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("row", models.PositiveIntegerField(blank=True, null=True)),
+                ("column", models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    "price",
+                    models.DecimalField(decimal_places=2, max_digits=6, null=True),
+                ),
+                ("created", models.DateTimeField(verbose_name="Created")),
+                ("modified", models.DateTimeField(verbose_name="Modified")),
+                (
+                    "storage",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="storage.storage",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="User",
+                    ),
+                ),
+                (
+                    "wine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="wine.wine"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived Storage Item",
+                "verbose_name_plural": "Archived Storage Items",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-created"],
+                        name="storage_arc_user_id_224926_idx",
+                    )
+                ],
+            },
+        ),
+    ]
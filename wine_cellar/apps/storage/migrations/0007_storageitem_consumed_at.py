@@ -0,0 +1,82 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:40
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_consumed_at(apps, schema_editor):
+    """The last modification is the best guess for when a bottle was drunk."""
+    for model_name in ("StorageItem", "ArchivedStorageItem"):
+        model = apps.get_model("storage", model_name)
+        items = model.objects.filter(consumed_at__isnull=True)
+        if model_name == "StorageItem":
+            items = items.filter(deleted=True)
+        items.update(consumed_at=F("modified"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0006_archivedstorageitem"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="archivedstorageitem",
+            name="storage_arc_user_id_224926_idx",
+        ),
+        migrations.AddField(
+            model_name="archivedstorageitem",
+            name="consumed_at",
+            field=models.DateTimeField(null=True, verbose_name="Consumed at"),
+        ),
+        migrations.AddField(
+            model_name="archivedstorageitem",
+            name="rating",
+            field=models.PositiveIntegerField(null=True, verbose_name="Rating"),
+        ),
+        migrations.AddField(
+            model_name="archivedstorageitem",
+            name="tasting_note",
+            field=models.TextField(blank=True, verbose_name="Tasting Note"),
+        ),
+        migrations.AddField(
+            model_name="storageitem",
+            name="consumed_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Consumed at"
+            ),
+        ),
+        migrations.AddField(
+            model_name="storageitem",
+            name="rating",
+            field=models.PositiveIntegerField(
+                blank=True,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(0),
+                    django.core.validators.MaxValueValidator(10),
+                ],
+                verbose_name="Rating",
+            ),
+        ),
+        migrations.AddField(
+            model_name="storageitem",
+            name="tasting_note",
+            field=models.TextField(blank=True, verbose_name="Tasting Note"),
+        ),
+        migrations.RunPython(backfill_consumed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="archivedstorageitem",
+            index=models.Index(
+                fields=["user", "consumed_at"], name="storage_arc_user_id_353162_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="storageitem",
+            index=models.Index(
+                fields=["user", "consumed_at"], name="storage_sto_user_id_c05e07_idx"
+            ),
+        ),
+    ]
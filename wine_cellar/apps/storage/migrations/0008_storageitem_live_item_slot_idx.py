@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-19 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0007_storageitem_consumed_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="storageitem",
+            index=models.Index(
+                condition=models.Q(("deleted", False)),
+                fields=["storage", "row", "column", "id"],
+                name="storage_live_item_slot_idx",
+            ),
+        ),
+    ]
@@ -1,9 +1,22 @@
+from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
 from wine_cellar.apps.wine.models import UserContentModel, Wine
 
 
+class StorageQuerySet(models.QuerySet):
+    def with_slots(self):
+        """Annotate the number of live items and the number of slots."""
+        return self.annotate(
+            live_item_count=models.Count(
+                "items", filter=models.Q(items__deleted=False)
+            ),
+            slot_count=models.F("rows") * models.F("columns"),
+        )
+
+
 class Storage(UserContentModel):
     name = models.CharField(max_length=100, verbose_name=_("Storage Name"))
     description = models.TextField(
@@ -13,6 +26,8 @@ class Storage(UserContentModel):
     rows = models.PositiveIntegerField(default=0, verbose_name=_("Number of Rows"))
     columns = models.PositiveIntegerField(default=0, verbose_name=_("Number of Columns"))
 
+    objects = StorageQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Storage")
         verbose_name_plural = _("Storages")
@@ -22,22 +37,36 @@ class Storage(UserContentModel):
 
     @property
     def total_slots(self):
+        if hasattr(self, "slot_count"):
+            return self.slot_count
         return self.rows * self.columns
 
     @property
     def used_slots(self):
-        return self.items.count()
+        # use the annotation of Storage.objects.with_slots() to avoid a query
+        if hasattr(self, "live_item_count"):
+            return self.live_item_count
+        return self.items.filter(deleted=False).count()
 
     @property
     def is_full(self):
         return self.used_slots >= self.total_slots
 
     def is_slot_occupied(self, row, column):
-        return self.items.filter(row=row, column=column).exists()
+        return self.items.filter(row=row, column=column, deleted=False).exists()
 
     @property
     def get_wines(self):
-        return self.items.filter(deleted=False).order_by("row", "column")
+        # items without a slot come first
+        return (
+            self.items.filter(deleted=False)
+            .select_related("wine")
+            .order_by(
+                models.F("row").asc(nulls_first=True),
+                models.F("column").asc(nulls_first=True),
+                "pk",
+            )
+        )
 
 
 class StorageItem(UserContentModel):
@@ -47,7 +76,64 @@ class StorageItem(UserContentModel):
     column = models.PositiveIntegerField(null=True, blank=True)
     deleted = models.BooleanField(default=False, db_index=True)
     price = models.DecimalField(max_digits=6, decimal_places=2, null=True)
+    consumed_at = models.DateTimeField(
+        null=True, blank=True, verbose_name=_("Consumed at")
+    )
+    tasting_note = models.TextField(blank=True, verbose_name=_("Tasting Note"))
+    rating = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0), MaxValueValidator(10)],
+        verbose_name=_("Rating"),
+    )
 
     class Meta:
         verbose_name = _("Storage Item")
         verbose_name_plural = _("Storage Items")
+        indexes = [
+            models.Index(fields=["user", "consumed_at"]),
+            # keyset pagination of the placed items in StorageDetailView
+            models.Index(
+                fields=["storage", "row", "column", "id"],
+                condition=models.Q(deleted=False),
+                name="storage_live_item_slot_idx",
+            ),
+        ]
+        constraints = [
+            # soft deleted items don't occupy their slot anymore
+            models.UniqueConstraint(
+                fields=["storage", "row", "column"],
+                condition=models.Q(deleted=False),
+                name="unique live slot",
+            )
+        ]
+
+
+class ArchivedStorageItem(models.Model):
+    """
+    A consumed StorageItem moved out of the live table by the
+    archive_storage_items task. It keeps the id and the timestamps of the item.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        verbose_name=_("User"),
+    )
+    storage = models.ForeignKey(Storage, on_delete=models.CASCADE)
+    wine = models.ForeignKey(Wine, on_delete=models.CASCADE)
+    row = models.PositiveIntegerField(null=True, blank=True)
+    column = models.PositiveIntegerField(null=True, blank=True)
+    price = models.DecimalField(max_digits=6, decimal_places=2, null=True)
+    consumed_at = models.DateTimeField(null=True, verbose_name=_("Consumed at"))
+    tasting_note = models.TextField(blank=True, verbose_name=_("Tasting Note"))
+    rating = models.PositiveIntegerField(null=True, verbose_name=_("Rating"))
+    created = models.DateTimeField(verbose_name=_("Created"))
+    modified = models.DateTimeField(verbose_name=_("Modified"))
+
+    class Meta:
+        verbose_name = _("Archived Storage Item")
+        verbose_name_plural = _("Archived Storage Items")
+        indexes = [models.Index(fields=["user", "consumed_at"])]
@@ -0,0 +1,104 @@
+import base64
+import time
+
+from django.core.cache import cache
+from django.db.models import FilteredRelation, Q
+
+from wine_cellar.apps.storage.models import Storage
+
+CACHE_KEY = "storage-occupancy:{user_id}:{version}"
+VERSION_KEY = "storage-occupancy-version:{user_id}"
+
+
+class Occupancy:
+    """
+    Occupied cells of a storage as a bitmap with one bit per cell, stored
+    row by row. Storages without rows or columns have an empty bitmap.
+    """
+
+    def __init__(self, rows, columns, bitmap=None):
+        self.rows = rows
+        self.columns = columns
+        if bitmap is None:
+            bitmap = bytearray((rows * columns + 7) // 8)
+        self.bitmap = bitmap
+
+    def _index(self, row, column):
+        return (row - 1) * self.columns + column - 1
+
+    def contains(self, row, column):
+        return 1 <= row <= self.rows and 1 <= column <= self.columns
+
+    def occupy(self, row, column):
+        if self.contains(row, column):
+            index = self._index(row, column)
+            self.bitmap[index >> 3] |= 1 << (index & 7)
+
+    def is_occupied(self, row, column):
+        index = self._index(row, column)
+        return bool(self.bitmap[index >> 3] & 1 << (index & 7))
+
+    def free_cells(self):
+        """Return the free columns of every row, {row: [column, ...]}."""
+        return {
+            row: [
+                column
+                for column in range(1, self.columns + 1)
+                if not self.is_occupied(row, column)
+            ]
+            for row in range(1, self.rows + 1)
+        }
+
+    def to_json(self):
+        """Encode the bitmap for the client, see stock_add.ts."""
+        return {
+            "rows": self.rows,
+            "columns": self.columns,
+            "occupied": base64.b64encode(self.bitmap).decode(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        bitmap = bytearray(base64.b64decode(data["occupied"]))
+        return cls(data["rows"], data["columns"], bitmap)
+
+
+def build_occupancy(user):
+    """Build the occupancy of all storages of a user with a single query."""
+    cells = (
+        Storage.objects.filter(user=user)
+        .annotate(stock=FilteredRelation("items", condition=Q(items__deleted=False)))
+        .values_list("pk", "rows", "columns", "stock__row", "stock__column")
+        .order_by()
+    )
+    occupancy = {}
+    for pk, rows, columns, row, column in cells:
+        if pk not in occupancy:
+            occupancy[pk] = Occupancy(rows, columns)
+        if row and column:
+            occupancy[pk].occupy(row, column)
+    return occupancy
+
+
+def get_occupancy(user):
+    """
+    Return the occupancy of all storages of a user, {storage_pk: Occupancy}.
+    Results are cached until invalidate_occupancy is called for the user.
+    """
+    key = CACHE_KEY.format(user_id=user.pk, version=storage_version(user.pk))
+    occupancy = cache.get(key)
+    if occupancy is None:
+        occupancy = build_occupancy(user)
+        cache.set(key, occupancy)
+    return occupancy
+
+
+def storage_version(user_id):
+    """Return the current version of the storages of a user."""
+    return cache.get_or_set(VERSION_KEY.format(user_id=user_id), time.time_ns)
+
+
+def invalidate_occupancy(user_id):
+    # a new version instead of deleting the entry, so a result computed
+    # from data read before the change can't be stored as current
+    cache.set(VERSION_KEY.format(user_id=user_id), time.time_ns(), None)
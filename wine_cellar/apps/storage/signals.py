@@ -1,10 +1,13 @@
 from typing import Any
 
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from wine_cellar.apps.storage.models import Storage
+from wine_cellar.apps.storage.models import Storage, StorageItem
+from wine_cellar.apps.storage.occupancy import invalidate_occupancy
+from wine_cellar.apps.wine.models import Wine
 
 User = get_user_model()
 
@@ -23,3 +26,32 @@ def create_storage(
             rows=0,
             columns=0,
         )
+
+
+# fields of a wine shown in the storage grids
+GRID_WINE_FIELDS = {"name", "vintage"}
+
+
+@receiver(post_save, sender=Storage)
+@receiver(post_delete, sender=Storage)
+@receiver(post_save, sender=StorageItem)
+@receiver(post_delete, sender=StorageItem)
+@receiver(post_save, sender=Wine)
+@receiver(post_delete, sender=Wine)
+def update_occupancy(sender: type, instance: Any, **kwargs: Any) -> None:
+    """
+    Invalidate the cached storage occupancy and grids once the change is
+    committed. Changed wines only update the labels of the grids.
+    """
+    if sender is StorageItem and instance.deleted and kwargs["signal"] is post_delete:
+        # removing a consumed bottle, e.g. when it is archived, frees no slot
+        return
+    if sender is Wine and kwargs["signal"] is post_save:
+        update_fields = kwargs["update_fields"]
+        if kwargs["created"] or (
+            update_fields is not None and not GRID_WINE_FIELDS & update_fields
+        ):
+            # new wines have no bottles, other fields aren't shown in the grids
+            return
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_occupancy(user_id))
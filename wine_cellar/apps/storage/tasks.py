@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from wine_cellar.apps.storage.models import ArchivedStorageItem, StorageItem
+
+ARCHIVED_FIELDS = [
+    "id",
+    "user_id",
+    "storage_id",
+    "wine_id",
+    "row",
+    "column",
+    "price",
+    "consumed_at",
+    "tasting_note",
+    "rating",
+    "created",
+    "modified",
+]
+
+
+def archive_batch(cutoff, batch_size):
+    """Move one batch of consumed items older than cutoff, return its size."""
+    with transaction.atomic():
+        items = list(
+            StorageItem.objects.filter(deleted=True, consumed_at__lt=cutoff)
+            .order_by("pk")
+            .values(*ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not items:
+            return 0
+        # ignore rows archived by an earlier run which failed before deleting
+        ArchivedStorageItem.objects.bulk_create(
+            [ArchivedStorageItem(**item) for item in items], ignore_conflicts=True
+        )
+        StorageItem.objects.filter(pk__in=[item["id"] for item in items]).delete()
+    return len(items)
+
+
+@shared_task(name="archive_storage_items")
+def archive_storage_items(days=None, batch_size=None):
+    """
+    Move consumed bottles which were consumed more than days ago from the
+    StorageItem table to ArchivedStorageItem in batches, so live stock
+    queries don't have to skip them. Returns the number of archived items.
+    """
+    if days is None:
+        days = settings.STORAGE_ARCHIVE_AFTER_DAYS
+    batch_size = batch_size or settings.STORAGE_ARCHIVE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=days)
+    archived = 0
+    while count := archive_batch(cutoff, batch_size):
+        archived += count
+    return archived
@@ -1,12 +1,31 @@
+from django.db.models import Q
 from django.forms import model_to_dict
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.views.generic import DeleteView, DetailView, FormView, ListView
-from django.views.generic.list import MultipleObjectMixin
-
-from wine_cellar.apps.storage.forms import StockAddForm, StorageForm
-from wine_cellar.apps.storage.models import Storage, StorageItem
+from django.views.generic import DeleteView, DetailView, FormView, ListView, View
+
+from wine_cellar.apps.storage.allocator import (
+    SlotUnavailable,
+    allocate_slots,
+    move_items,
+)
+from wine_cellar.apps.storage.forms import (
+    StockAddForm,
+    StockConsumeForm,
+    StockMoveForm,
+    StorageForm,
+    StorageItemFilterForm,
+)
+from wine_cellar.apps.storage.grid import get_grid
+from wine_cellar.apps.storage.models import (
+    ArchivedStorageItem,
+    Storage,
+    StorageItem,
+)
+from wine_cellar.apps.storage.occupancy import get_occupancy
 from wine_cellar.apps.wine.models import Wine
 
 
@@ -17,28 +36,75 @@ class StorageListView(ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by("created")
+        qs = super().get_queryset().with_slots().order_by("created")
         return qs.filter(user=self.request.user)
 
 
-class StorageDetailView(DetailView, MultipleObjectMixin):
+class StorageDetailView(DetailView):
     template_name = "storage_detail.html"
     model = Storage
     paginate_by = 10
 
     def get_context_data(self, **kwargs):
-        object = self.get_object()
-        object_list = object.get_wines
-        context = super(StorageDetailView, self).get_context_data(
-            object_list=object_list, **kwargs
+        context = super().get_context_data(**kwargs)
+        filter_form = StorageItemFilterForm(self.request.GET)
+        filters = filter_form.cleaned_data if filter_form.is_valid() else {}
+        items = self.object.get_wines
+        if filters.get("row_from"):
+            items = items.filter(row__gte=filters["row_from"])
+        if filters.get("row_to"):
+            items = items.filter(row__lte=filters["row_to"])
+        # keyset pagination, continue after the last item of the previous
+        # page. Items without a slot come first, the placed items are read
+        # in slot order from the live slot index.
+        after = filters.get("after")
+        limit = self.paginate_by + 1
+        object_list = []
+        if not after or len(after) == 1:
+            unplaced = items.filter(Q(row__isnull=True) | Q(column__isnull=True))
+            if after:
+                unplaced = unplaced.filter(pk__gt=after[0])
+            object_list = list(unplaced.order_by("pk")[:limit])
+        if len(object_list) < limit:
+            placed = items.filter(row__isnull=False, column__isnull=False)
+            if after and len(after) == 3:
+                row, column, pk = after
+                placed = placed.filter(row__gte=row).filter(
+                    Q(row__gt=row)
+                    | Q(row=row, column__gt=column)
+                    | Q(row=row, column=column, pk__gt=pk)
+                )
+            placed = placed.order_by("row", "column", "pk")
+            object_list += list(placed[: limit - len(object_list)])
+        next_cursor = None
+        if len(object_list) > self.paginate_by:
+            object_list = object_list[: self.paginate_by]
+            last = object_list[-1]
+            if last.row is None or last.column is None:
+                next_cursor = str(last.pk)
+            else:
+                next_cursor = f"{last.row}.{last.column}.{last.pk}"
+        context.update(
+            {
+                "object_list": object_list,
+                "filter_form": filter_form,
+                "next_cursor": next_cursor,
+                "is_first_page": not after,
+            }
         )
         return context
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        qs = super().get_queryset().with_slots()
         return qs.filter(user=self.request.user)
 
 
+class StorageGridView(View):
+    def get(self, request, pk):
+        storage = get_object_or_404(Storage, pk=pk, user=request.user)
+        return JsonResponse(get_grid(storage))
+
+
 class StorageCreateView(FormView):
     template_name = "storage_create.html"
     form_class = StorageForm
@@ -139,30 +205,21 @@ class StorageItemAddView(FormView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user_storages = Storage.objects.filter(user=self.request.user)
-        free_cells_by_storage = {}
-        for storage in user_storages:
-            if storage.rows == 0:
-                free_cells_by_storage[storage.pk] = {}
-                continue
-            used_cells = set(
-                storage.items.filter(deleted=False).values_list("row", "column")
-            )
-            all_rows = range(1, storage.rows + 1)
-            all_columns = range(1, storage.columns + 1)
-            free_cells_by_storage[storage.pk] = {}
-            for row in all_rows:
-                free = []
-                for column in all_columns:
-                    if (row, column) not in used_cells:
-                        free.append(column)
-                free_cells_by_storage[storage.pk][row] = free
-        context["free_cells_by_storage"] = free_cells_by_storage
+        occupancy = get_occupancy(self.request.user)
+        context["free_cells_by_storage"] = {
+            pk: storage_occupancy.to_json()
+            for pk, storage_occupancy in occupancy.items()
+        }
         return context
 
     def form_valid(self, form):
         wine = get_object_or_404(Wine, pk=self.kwargs["pk"], user=self.request.user)
-        self.process_form_data(wine, self.request.user, form.cleaned_data)
+        try:
+            self.process_form_data(wine, self.request.user, form.cleaned_data)
+        except SlotUnavailable as e:
+            # the slot was taken since the form was validated
+            form.add_error(None, str(e))
+            return self.form_invalid(form)
         self.success_url = reverse_lazy("wine-detail", kwargs={"pk": wine.pk})
         return super().form_valid(form)
 
@@ -172,20 +229,56 @@ class StorageItemAddView(FormView):
         row = cleaned_data["row"]
         column = cleaned_data["column"]
         price = cleaned_data.get("price")
+        quantity = cleaned_data.get("quantity") or 1
+        if cleaned_data.get("auto_place"):
+            row = column = None
 
-        StorageItem.objects.create(
-            storage=storage,
-            wine=wine,
-            row=row,
-            column=column,
-            user=user,
-            price=price,
+        allocate_slots(
+            storage, wine, user, quantity, row=row, column=column, price=price
+        )
+
+
+class StorageItemMoveView(FormView):
+    template_name = "stock_move.html"
+    form_class = StockMoveForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        if self.request.method == "GET":
+            # the bottles selected on the storage page
+            kwargs["initial"] = {"items": self.request.GET.getlist("items")}
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = context["form"]
+        selected = [str(pk) for pk in form["items"].value() or []]
+        context["selected_items"] = form.fields["items"].queryset.filter(
+            pk__in=[pk for pk in selected if pk.isdigit()]
         )
+        return context
+
+    def form_valid(self, form):
+        storage = form.cleaned_data["storage"]
+        try:
+            move_items(
+                form.cleaned_data["items"].order_by("storage", "row", "column", "pk"),
+                storage,
+                row=form.cleaned_data["row"],
+                column=form.cleaned_data["column"],
+            )
+        except SlotUnavailable as e:
+            form.add_error(None, str(e))
+            return self.form_invalid(form)
+        self.success_url = reverse_lazy("storage-detail", kwargs={"pk": storage.pk})
+        return super().form_valid(form)
 
 
 class StorageItemDeleteView(DeleteView):
     model = StorageItem
     template_name = "storage_item_confirm_delete.html"
+    form_class = StockConsumeForm
 
     def get_success_url(self):
         next = self.request.GET.get("next")
@@ -200,10 +293,48 @@ class StorageItemDeleteView(DeleteView):
     def form_valid(self, form):
         self.object = self.get_object()
         self.object.deleted = True
-        self.object.save(update_fields=["deleted"])
+        self.object.consumed_at = timezone.now()
+        self.object.tasting_note = form.cleaned_data["tasting_note"]
+        self.object.rating = form.cleaned_data["rating"]
+        self.object.save(
+            update_fields=["deleted", "consumed_at", "tasting_note", "rating"]
+        )
         return redirect(self.get_success_url())
 
 
+class ConsumedItemKeys:
+    """
+    The (consumed_at, id, archived) keys of consumed items in the live and
+    the archive table, newest first. Slicing reads only as many rows of each
+    table as the slice needs, so a page is one index range per table.
+    """
+
+    ordered = True
+
+    def __init__(self, live, archived):
+        self.tables = [(self.keys(live), False), (self.keys(archived), True)]
+
+    @staticmethod
+    def keys(queryset):
+        # consumed_at is set when consuming and was backfilled for old items
+        return (
+            queryset.filter(consumed_at__isnull=False)
+            .order_by("-consumed_at", "-id")
+            .values_list("consumed_at", "id")
+        )
+
+    def count(self):
+        return sum(keys.count() for keys, _archived in self.tables)
+
+    def __getitem__(self, index):
+        stop = index.stop if isinstance(index, slice) else index + 1
+        rows = []
+        for keys, archived in self.tables:
+            rows += [(consumed_at, pk, archived) for consumed_at, pk in keys[:stop]]
+        rows.sort(key=lambda row: (row[0], row[1]), reverse=True)
+        return rows[index]
+
+
 class StorageItemHistoryView(ListView):
     model = StorageItem
     template_name = "storage_item_history.html"
@@ -211,5 +342,26 @@ class StorageItemHistoryView(ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        qs = super().get_queryset().order_by("-created")
-        return qs.filter(user=self.request.user, deleted=True)
+        # consumed items are in the live table until they are archived, page
+        # over the keys of both tables and load the items of the page only
+        return ConsumedItemKeys(
+            StorageItem.objects.filter(user=self.request.user, deleted=True),
+            ArchivedStorageItem.objects.filter(user=self.request.user),
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        keys = context["object_list"]
+        items = {}
+        for model, is_archived in ((StorageItem, False), (ArchivedStorageItem, True)):
+            pks = [pk for _consumed_at, pk, archived in keys if archived == is_archived]
+            if pks:
+                found = model.objects.select_related("wine", "storage").in_bulk(pks)
+                items.update({(pk, is_archived): item for pk, item in found.items()})
+        storage_items = [
+            items[pk, bool(archived)]
+            for _consumed_at, pk, archived in keys
+            if (pk, bool(archived)) in items
+        ]
+        context["object_list"] = context["storage_items"] = storage_items
+        return context
@@ -1,16 +1,29 @@
 from django.forms import ModelForm
 from django.utils.translation import gettext_lazy as _
 
-from wine_cellar.apps.user.models import UserSettings
+from wine_cellar.apps.user.models import (
+    UserSettings,
+    parse_reminder_days,
+    validate_reminder_days,
+)
 
 
 class UserSettingsForm(ModelForm):
 
     class Meta:
         model = UserSettings
-        fields = ["language", "currency", "notifications"]
+        fields = ["language", "currency", "notifications", "reminder_days"]
         help_texts = {
             "language": _("The language the site is displayed in."),
             "currency": _("The default currency used for the price of a wine."),
             "notifications": _("Receive email notifications."),
+            "reminder_days": _(
+                "Comma separated days before the drink by date of a wine to send"
+                " a reminder, e.g. 14, 3. Leave empty for no reminders."
+            ),
         }
+
+    def clean_reminder_days(self):
+        value = self.cleaned_data["reminder_days"]
+        validate_reminder_days(value)
+        return ",".join(str(day) for day in parse_reminder_days(value))
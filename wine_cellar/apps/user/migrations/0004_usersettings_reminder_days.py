@@ -0,0 +1,26 @@
+# Generated by Django 5.2.9 on 2026-10-19 20:10
+
+from django.db import migrations, models
+
+import wine_cellar.apps.user.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0003_usersettings_notifications"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usersettings",
+            name="reminder_days",
+            field=models.CharField(
+                blank=True,
+                default="14",
+                max_length=50,
+                validators=[wine_cellar.apps.user.models.validate_reminder_days],
+                verbose_name="Reminder days",
+            ),
+        ),
+    ]
@@ -1,8 +1,25 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+# days before the drink by date of a wine reminders are sent by default
+DEFAULT_REMINDER_DAYS = "14"
+# the most days before the drink by date a reminder can be sent
+MAX_REMINDER_DAYS = 365
+
+
+def validate_reminder_days(value: str):
+    for day in value.split(","):
+        day = day.strip()
+        if day and not (day.isdigit() and 1 <= int(day) <= MAX_REMINDER_DAYS):
+            raise ValidationError(
+                _("Enter days between 1 and %(max)s separated by commas."),
+                code="invalid",
+                params={"max": MAX_REMINDER_DAYS},
+            )
+
 
 class UserSettings(models.Model):
     user = models.OneToOneField(
@@ -27,6 +44,13 @@ class UserSettings(models.Model):
         default=True,
         verbose_name=_("Notifications"),
     )
+    reminder_days = models.CharField(
+        max_length=50,
+        blank=True,
+        default=DEFAULT_REMINDER_DAYS,
+        validators=[validate_reminder_days],
+        verbose_name=_("Reminder days"),
+    )
 
     class Meta:
         verbose_name = _("User Settings")
@@ -34,3 +58,18 @@ class UserSettings(models.Model):
 
     def __str__(self):
         return f"Settings for {self.user}"
+
+    @property
+    def reminder_horizons(self):
+        return parse_reminder_days(self.reminder_days)
+
+
+def parse_reminder_days(value: str) -> list[int]:
+    """
+    Return the days of a comma separated list like "14, 3" sorted, [3, 14].
+    Invalid days, e.g. stored before they were validated, are left out.
+    """
+    days = {day.strip() for day in value.split(",")}
+    return sorted(
+        int(day) for day in days if day.isdigit() and 1 <= int(day) <= MAX_REMINDER_DAYS
+    )
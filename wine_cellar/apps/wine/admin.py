@@ -2,6 +2,7 @@ from django.contrib import admin
 
 from wine_cellar.apps.wine.models import (
     Attribute,
+    DrinkByReminder,
     FoodPairing,
     Grape,
     Size,
@@ -51,3 +52,9 @@ class SourceAdmin(admin.ModelAdmin):
 class AttributeAdmin(admin.ModelAdmin):
     list_display = ["name", "user"]
     fields = ["name", "user"]
+
+
+@admin.register(DrinkByReminder)
+class DrinkByReminderAdmin(admin.ModelAdmin):
+    list_display = ["wine", "drink_by", "horizon", "sent", "user"]
+    readonly_fields = ["wine", "drink_by", "horizon", "sent", "user"]
@@ -0,0 +1,121 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from wine_cellar.apps.wine.models import Wine
+from wine_cellar.apps.wine.utils import LRUCache, normalize_name
+
+INDEX_KEY = "wine-name-index:{user_id}:{version}"
+VERSION_KEY = "wine-name-index-version:{user_id}"
+
+
+def trigrams(key: str) -> set[str]:
+    """Trigrams of the words of a normalized name, padded like pg_trgm."""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameIndex:
+    """
+    Inverted trigram index of the normalized wine names of a user. Only the
+    wines sharing a trigram with the searched name are scored, with the
+    trigram similarity of pg_trgm.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        # wine id -> (number of trigrams, vintage, vineyard ids)
+        self.wines = {}
+
+    def __len__(self):
+        return len(self.wines)
+
+    def add(self, wine_id, key, vintage=None, vineyards=()):
+        grams = trigrams(key)
+        self.wines[wine_id] = (len(grams), vintage, frozenset(vineyards))
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(wine_id)
+
+    def search(self, key, vintage=None, vineyards=(), min_similarity=0.0):
+        """
+        Return (score, wine id) of the wines with a similar name, best first.
+        The score is the name similarity, ties are broken by a matching
+        vintage and vineyard.
+        """
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        results = []
+        for wine_id, count in shared.items():
+            size, wine_vintage, wine_vineyards = self.wines[wine_id]
+            similarity = count / (len(grams) + size - count)
+            if similarity < min_similarity:
+                continue
+            same_vintage = vintage is not None and vintage == wine_vintage
+            same_vineyard = bool(wine_vineyards.intersection(vineyards))
+            results.append(((similarity, same_vintage, same_vineyard), wine_id))
+        results.sort(key=lambda result: result[0], reverse=True)
+        return results
+
+
+# per process cache of user_id -> (version, NameIndex) of the recently used users
+_indexes = LRUCache(settings.WINE_INDEX_CACHE_SIZE)
+
+
+def name_index_version(user_id):
+    """Return the version of the wine names of a user shared by all processes."""
+    return cache.get_or_set(VERSION_KEY.format(user_id=user_id), time.time_ns)
+
+
+def invalidate_name_index(user_id):
+    # a new version instead of deleting the entry, so an index built from
+    # data read before the change can't be stored as current
+    cache.set(VERSION_KEY.format(user_id=user_id), time.time_ns(), None)
+
+
+def build_name_index(user) -> NameIndex:
+    vineyards = {}
+    through = Wine.vineyard.through.objects.filter(wine__user=user)
+    for wine_id, vineyard_id in through.values_list("wine_id", "vineyard_id"):
+        vineyards.setdefault(wine_id, []).append(vineyard_id)
+    index = NameIndex()
+    rows = Wine.objects.filter(user=user).values_list("pk", "name_key", "vintage")
+    for pk, key, vintage in rows.iterator():
+        index.add(pk, key, vintage, vineyards.get(pk, ()))
+    return index
+
+
+def get_name_index(user) -> NameIndex:
+    """
+    Return the name index of the wines of a user. Indexes are built once for
+    all processes and kept in the cache until the signals in signals.py bump
+    the version of the user, each process also keeps the recently used ones.
+    """
+    version = name_index_version(user.pk)
+    cached = _indexes.get(user.pk)
+    if cached and cached[0] == version:
+        return cached[1]
+    key = INDEX_KEY.format(user_id=user.pk, version=version)
+    index = cache.get(key)
+    if index is None:
+        index = build_name_index(user)
+        cache.set(key, index)
+    _indexes.set(user.pk, (version, index))
+    return index
+
+
+def find_duplicates(user, name, vintage=None, vineyards=(), limit=5):
+    """Return the ids of the wines of a user which are possible duplicates."""
+    key = normalize_name(name)
+    if not key:
+        return []
+    results = get_name_index(user).search(
+        key, vintage, vineyards, settings.WINE_DUPLICATE_MIN_SIMILARITY
+    )
+    return [wine_id for _score, wine_id in results[:limit]]
@@ -3,13 +3,18 @@ from django.template.loader import render_to_string
 from django.utils.translation import gettext_lazy as _
 
 
-def send_drink_by_reminder(user, wines):
+def drink_by_reminder_message(user, wines, connection=None):
+    """
+    Build the reminder of a user about wines to drink soon. The wines need
+    their number of bottles in stock annotated as stock.
+    """
     text_content = render_to_string(
         "emails/drink_by_reminder.txt",
         context={"wines": wines, "user": user},
     )
-
-    msg = EmailMultiAlternatives(
-        _("Reminder to drink your wine(s)"), text_content, to=[user.email]
+    return EmailMultiAlternatives(
+        _("Reminder to drink your wine(s)"),
+        text_content,
+        to=[user.email],
+        connection=connection,
     )
-    msg.send()
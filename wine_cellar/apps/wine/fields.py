@@ -1,4 +1,6 @@
 from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from django.db.models.functions import Lower
 from django.forms import ModelMultipleChoiceField
 from django.utils.translation import gettext_lazy as _
 
@@ -35,20 +37,22 @@ class OpenMultipleChoiceField(ModelMultipleChoiceField):
         """
         key = self.to_field_name or "pk"
         # deduplicate given values to avoid creating many querysets or
-        # requiring the database backend deduplicate efficiently.
+        # requiring the database backend deduplicate efficiently, keeping the
+        # order so the first spelling of a new value is used.
         try:
-            value = frozenset(value)
+            value = dict.fromkeys(value)
         except TypeError:
             # list of lists isn't hashable, for example
             raise ValidationError(
                 self.error_messages["invalid_list"],
                 code="invalid_list",
             )
-        new_values = set()
+        pks = set()
+        new_values = {}
         for pk in value:
             try:
                 self.queryset.filter(**{key: pk})
-                new_values.add(pk)
+                pks.add(pk)
             except ValueError:
                 # assume not a pk but a new value
                 if isinstance(pk, str) and pk.startswith("tom_new_opt"):
@@ -62,10 +66,7 @@ class OpenMultipleChoiceField(ModelMultipleChoiceField):
                                 code="invalid_new_value",
                                 params={"pk": pk},
                             )
-                    new_value, _ = self.queryset.get_or_create(
-                        **{self.field_name: v, "user": self.user}
-                    )
-                    new_values.add(new_value.pk)
+                    new_values.setdefault(self._fold(v), v)
                 elif isinstance(pk, str) and not self.required and pk == "":
                     continue
                 else:
@@ -80,14 +81,65 @@ class OpenMultipleChoiceField(ModelMultipleChoiceField):
                     code="invalid_pk_value",
                     params={"pk": pk},
                 )
-        value = new_values
-        qs = self.queryset.filter(**{"%s__in" % key: value})
-        pks = {str(getattr(o, key)) for o in qs}
-        for val in value:
-            if str(val) not in pks:
+        existing_pks, created = self._create_values(new_values)
+        pks |= existing_pks
+        lookup = Q(**{"%s__in" % key: pks})
+        qs = self.queryset
+        if created:
+            # matched ignoring the case like existing values, a concurrent
+            # request may have created a value with another spelling
+            created = {self._fold(v): v for v in created}
+            qs = self._with_folded(qs, created.values())
+            lookup |= Q(folded__in=created, user=self.user)
+        qs = qs.filter(lookup)
+        found = {str(getattr(o, key)) for o in qs}
+        for val in pks:
+            if str(val) not in found:
                 raise ValidationError(
                     self.error_messages["invalid_choice"],
                     code="invalid_choice",
                     params={"value": val},
                 )
+        if created:
+            found = {o.folded for o in qs}
+            for folded, v in created.items():
+                if folded not in found:
+                    raise ValidationError(
+                        self.error_messages["invalid_new_value"],
+                        code="invalid_new_value",
+                        params={"pk": v},
+                    )
         return qs
+
+    def _with_folded(self, queryset, values):
+        """Annotate the value of the field as folded, lowercased for strings."""
+        if any(isinstance(v, str) for v in values):
+            return queryset.annotate(folded=Lower(self.field_name))
+        return queryset.annotate(folded=F(self.field_name))
+
+    @staticmethod
+    def _fold(value):
+        return value.lower() if isinstance(value, str) else value
+
+    def _create_values(self, new_values):
+        """
+        Create the objects for new values, {folded value: value}, which don't
+        exist yet in a single query. Existing objects of the queryset are
+        matched ignoring the case. Return the pks of the existing objects and
+        the created values.
+        """
+        if not new_values:
+            return set(), []
+        field = self.field_name
+        existing = dict(
+            self._with_folded(self.queryset, new_values.values())
+            .filter(folded__in=new_values)
+            .values_list("folded", "pk")
+        )
+        created = [v for k, v in new_values.items() if k not in existing]
+        # values created by a concurrent request are fetched by the caller
+        self.queryset.model.objects.bulk_create(
+            [self.queryset.model(**{field: v, "user": self.user}) for v in created],
+            ignore_conflicts=True,
+        )
+        return set(existing.values()), created
@@ -152,25 +152,23 @@ class WineBaseForm(TomSelectMixin, WineFormPostCleanMixin, forms.Form):
             "Enter the price of the bottle in %(currency)s."
         ) % {"currency": settings.CURRENCY_SYMBOLS[user_settings.currency]}
 
+        wine_id = self.initial.get("id")
+        if wine_id:
+            self.set_existing_images(wine_id)
+
+    def set_existing_images(self, wine_id):
+        """Show the latest image of every type, loaded with a single query."""
+        images = {}
+        for image in WineImage.objects.filter(wine=wine_id).order_by("-id"):
+            images.setdefault(image.image_type, image)
         for field_name, image_type_code in image_fields_map.items():
-            field = self.fields.get(field_name)
-            if not field:
+            image_obj = images.get(image_type_code)
+            if not image_obj or field_name not in self.fields:
                 continue
-            if getattr(self, "initial", None):
-                wine_id = self.initial.get("id")
-                if wine_id:
-                    image_obj = (
-                        WineImage.objects.filter(
-                            wine=wine_id, image_type=image_type_code
-                        )
-                        .order_by("-id")
-                        .first()
-                    )
-                    if image_obj:
-                        self.initial[field_name] = image_obj.thumbnail
-                        self.fields[field_name].widget.attrs[
-                            "data-existing-url"
-                        ] = image_obj.thumbnail.url
+            # the original is shown until the thumbnail has been generated
+            existing = image_obj.thumbnail or image_obj.image
+            self.initial[field_name] = existing
+            self.fields[field_name].widget.attrs["data-existing-url"] = existing.url
 
     class Meta:
         abstract = True
@@ -338,6 +336,11 @@ class WineForm(WineBaseForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.initial["form_step"] = 0
+        # photos uploaded in an earlier step, see WineCreateView
+        for field_name in image_fields_map:
+            self.fields[f"{field_name}_token"] = forms.CharField(
+                widget=forms.HiddenInput(), label="", required=False
+            )
         self.set_tom_config(name="grapes", create=True)
         self.set_tom_config(name="attributes", create=True)
         self.set_tom_config(name="food_pairings", create=True)
@@ -448,3 +451,13 @@ class WineFilterForm(TomSelectMixin, WineFormPostCleanMixin, forms.Form):
         self.set_tom_config(
             name="country", create=False, max_options=-1, placeholder=""
         )
+
+
+class LabelSearchForm(forms.Form):
+    image = ImageField(
+        label=_("Label"),
+        help_text=_("Take a photo of the label to find the wine in your cellar."),
+        widget=forms.ClearableFileInput(
+            attrs={"accept": "image/*", "capture": "environment"}
+        ),
+    )
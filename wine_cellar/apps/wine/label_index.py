@@ -0,0 +1,112 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from wine_cellar.apps.wine.models import LABEL_IMAGE_TYPES, WineImage
+from wine_cellar.apps.wine.utils import LRUCache
+
+HASH_MASK = (1 << 64) - 1
+VERSION_KEY = "wine-label-index-version:{user_id}"
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of perceptual hashes. Searching for hashes within a
+    small hamming distance only visits the branches which can contain
+    matches instead of comparing against every hash.
+    """
+
+    def __init__(self):
+        # nodes are [hash, items, {distance: child node}]
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value: int, item) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, object]]:
+        """Return (distance, item) of all hashes within max_distance, closest first."""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            # by the triangle inequality matches can only be in these children
+            for child_distance, child in node[2].items():
+                if abs(child_distance - distance) <= max_distance:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+# per process cache of user_id -> (version, BKTree) of the recently used users
+_indexes = LRUCache(settings.WINE_INDEX_CACHE_SIZE)
+
+
+def label_index_version(user_id):
+    """Return the version of the label hashes of a user shared by all processes."""
+    return cache.get_or_set(VERSION_KEY.format(user_id=user_id), time.time_ns)
+
+
+def invalidate_label_index(user_id):
+    """Make every process rebuild the label index of a user, see get_label_index."""
+    cache.set(VERSION_KEY.format(user_id=user_id), time.time_ns(), None)
+
+
+def get_label_index(user) -> BKTree:
+    """
+    Return the BK-tree of the label hashes of a user, mapping to wine ids.
+    The tree is rebuilt when images were added or removed since it was built,
+    or when their hashes were rewritten and invalidate_label_index was called.
+    """
+    images = WineImage.objects.filter(
+        user=user, image_type__in=LABEL_IMAGE_TYPES, phash__isnull=False
+    )
+    version = (
+        label_index_version(user.pk),
+        images.aggregate(count=Count("pk"), last=Max("pk")),
+    )
+    cached = _indexes.get(user.pk)
+    if cached and cached[0] == version:
+        return cached[1]
+    tree = BKTree()
+    for phash, wine_id in images.values_list("phash", "wine_id").iterator():
+        tree.add(phash, wine_id)
+    _indexes.set(user.pk, (version, tree))
+    return tree
+
+
+def find_wines_by_label(user, phash: int, max_distance=None) -> list[int]:
+    """Return the ids of the wines with a similar label, best match first."""
+    if max_distance is None:
+        max_distance = settings.WINE_LABEL_MAX_DISTANCE
+    wine_ids = []
+    for _distance, wine_id in get_label_index(user).search(phash, max_distance):
+        if wine_id not in wine_ids:
+            wine_ids.append(wine_id)
+    return wine_ids
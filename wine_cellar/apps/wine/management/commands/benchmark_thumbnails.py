@@ -0,0 +1,106 @@
+import io
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import ExifTags, Image
+
+from wine_cellar.apps.wine.utils import THUMBNAIL_HEIGHT, downscale, open_image
+
+# the image pipeline before and after the fast decode path
+MODES = {
+    "legacy": {"draft": False, "reducing_gap": None},
+    "fast": {"draft": True, "reducing_gap": 3.0},
+}
+
+
+def in_subprocess(fn, *args):
+    """
+    Call fn in a fresh process. Besides isolating the peak RSS of each run,
+    this keeps the parent small: on Linux a child's peak RSS starts at the
+    RSS of its parent at fork time.
+    """
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def create_corpus(directory, count, width, height):
+    """Write count synthetic camera-like JPEGs rotated by EXIF to directory."""
+    paths = []
+    for i in range(count):
+        noise = Image.effect_noise((width, height), 40 + i)
+        gradient = Image.linear_gradient("L").resize((width, height))
+        img = Image.merge("RGB", (noise, gradient, gradient.transpose(0)))
+        exif = Image.Exif()
+        exif[ExifTags.Base.Orientation] = 6
+        path = Path(directory, f"image_{i}.jpg")
+        img.save(path, format="JPEG", quality=90, exif=exif)
+        paths.append(path)
+    return paths
+
+
+def process(path, widths, draft, reducing_gap):
+    """Decode one image and encode its thumbnail and all variants in memory."""
+    size = (max(widths), THUMBNAIL_HEIGHT) if draft else None
+    img = open_image(path, size)
+    outputs = [
+        (round(THUMBNAIL_HEIGHT * img.width / img.height), THUMBNAIL_HEIGHT),
+        *[(w, round(w * img.height / img.width)) for w in widths if w < img.width],
+    ]
+    for output in outputs:
+        buffer = io.BytesIO()
+        downscale(img, output, reducing_gap).save(buffer, format="WEBP")
+
+
+def run(paths, widths, mode):
+    """Process all paths in the current process, return ms/image and peak RSS."""
+    start = time.perf_counter()
+    for path in paths:
+        process(path, widths, **MODES[mode])
+    elapsed = (time.perf_counter() - start) * 1000 / len(paths)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB elsewhere
+    if sys.platform != "darwin":
+        max_rss *= 1024
+    return elapsed, max_rss
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark thumbnail and variant generation on synthetic large JPEGs, "
+        "comparing full decoding with the draft mode decode path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10)
+        parser.add_argument("--width", type=int, default=4032)
+        parser.add_argument("--height", type=int, default=3024)
+
+    def handle(self, *args, **options):
+        widths = settings.WINE_IMAGE_VARIANT_WIDTHS
+        with tempfile.TemporaryDirectory() as directory:
+            paths = in_subprocess(
+                create_corpus,
+                directory,
+                options["count"],
+                options["width"],
+                options["height"],
+            )
+            self.stdout.write(
+                f"Processing {len(paths)} images of "
+                f"{options['width']}x{options['height']}px"
+            )
+            for mode in MODES:
+                elapsed, max_rss = in_subprocess(run, paths, widths, mode)
+                self.stdout.write(
+                    f"{mode:>8}: {elapsed:8.1f} ms/image, "
+                    f"peak RSS {max_rss / 2**20:7.1f} MiB"
+                )
@@ -0,0 +1,236 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from wine_cellar.apps.wine.label_index import invalidate_label_index
+from wine_cellar.apps.wine.models import LABEL_IMAGE_TYPES, WineImage
+from wine_cellar.apps.wine.tasks import replace_original
+from wine_cellar.apps.wine.utils import (
+    THUMBNAIL_HEIGHT,
+    derived_names,
+    dhash,
+    ingest_image,
+    load_image,
+    make_placeholder,
+    make_thumbnail,
+    make_variants,
+)
+
+
+def rebuild_image(pk, image_name):
+    """
+    Normalize one original and create its thumbnail, variants, placeholder
+    and label hash. Runs in a worker process and does not touch the database, the
+    results, including the name of the normalized original, are stored by the
+    caller.
+    """
+    image = WineImage(pk=pk, image=image_name)
+    widths = settings.WINE_IMAGE_VARIANT_WIDTHS
+    try:
+        ingest_image(image)
+        img = load_image(image, (max(widths), THUMBNAIL_HEIGHT))
+        thumbnail = make_thumbnail(image, img=img)
+        variants = make_variants(image, widths, img=img)
+        placeholder = make_placeholder(image, img=img)
+        phash = dhash(img)
+    except OSError as e:
+        return pk, None, str(e)
+    return pk, (image.image.name, thumbnail, variants, placeholder, phash), None
+
+
+class Command(BaseCommand):
+    help = (
+        "(Re)create thumbnails and image variants in chunks using a process "
+        "pool. Progress is checkpointed so an interrupted run can be resumed "
+        "by running the command again with the same filters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", help="Only rebuild images of the user with this username."
+        )
+        parser.add_argument(
+            "--missing",
+            action="store_true",
+            help="Only build images with missing derived images or label hash.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=100)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes, 1 processes images in-process.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default="rebuild_thumbnails.checkpoint",
+            help="File the progress is stored in.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore an existing checkpoint and start from the beginning.",
+        )
+
+    def handle(self, *args, **options):
+        filters = {"user": options["user"], "missing": options["missing"]}
+        checkpoint = options["checkpoint"]
+        last_pk = 0
+        if not options["restart"]:
+            last_pk = self.read_checkpoint(checkpoint, filters)
+            if last_pk:
+                self.stdout.write(f"Resuming after image {last_pk}")
+
+        images = WineImage.objects.exclude(image="").order_by("pk")
+        if options["user"]:
+            images = images.filter(user__username=options["user"])
+        if options["missing"]:
+            images = images.filter(
+                Q(thumbnail__isnull=True)
+                | Q(thumbnail="")
+                | Q(variants=[])
+                | Q(placeholder="")
+                | Q(image_type__in=LABEL_IMAGE_TYPES, phash__isnull=True)
+            )
+        total = images.filter(pk__gt=last_pk).count()
+
+        executor = None
+        if options["workers"] > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        done = failed = 0
+        start = time.perf_counter()
+        try:
+            while True:
+                rows = list(
+                    images.filter(pk__gt=last_pk).values_list(
+                        "pk", "image", "thumbnail", "variants", "image_type"
+                    )[: options["chunk_size"]]
+                )
+                if not rows:
+                    break
+                pks, names = [row[0] for row in rows], [row[1] for row in rows]
+                # images with the same content share one file, build it once
+                unique = dict(zip(names, pks))
+                if executor:
+                    results = executor.map(rebuild_image, unique.values(), unique)
+                else:
+                    results = map(rebuild_image, unique.values(), unique)
+
+                built = {}
+                for pk, result, error in results:
+                    if error:
+                        self.stderr.write(f"Image {pk} failed: {error}")
+                        continue
+                    built[pk] = result
+                for name, pk in unique.items():
+                    if pk in built and built[pk][0] != name:
+                        replace_original(name, built[pk][0])
+                updated = []
+                for pk, name, _thumbnail, _variants, image_type in rows:
+                    result = built.get(unique[name])
+                    if result is None:
+                        failed += 1
+                        continue
+                    _name, thumbnail, variants, placeholder, phash = result
+                    if image_type not in LABEL_IMAGE_TYPES:
+                        phash = None
+                    updated.append(
+                        WineImage(
+                            pk=pk,
+                            thumbnail=thumbnail,
+                            variants=variants,
+                            placeholder=placeholder,
+                            phash=phash,
+                        )
+                    )
+                WineImage.objects.bulk_update(
+                    updated, ["thumbnail", "variants", "placeholder", "phash"]
+                )
+                hashed = [image.pk for image in updated if image.phash is not None]
+                for user_id in (
+                    WineImage.objects.filter(pk__in=hashed, user__isnull=False)
+                    .values_list("user_id", flat=True)
+                    .distinct()
+                ):
+                    invalidate_label_index(user_id)
+                originals = {*unique, *(result[0] for result in built.values())}
+                self.delete_replaced_files(rows, updated, originals)
+
+                done += len(rows)
+                last_pk = pks[-1]
+                self.write_checkpoint(checkpoint, filters, last_pk)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{done}/{total} images, {done / elapsed:.1f} images/s"
+                )
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {done - failed} images in {elapsed:.1f}s"
+                f" ({failed} failed)"
+            )
+        )
+
+    @staticmethod
+    def delete_replaced_files(rows, updated, originals):
+        """
+        Delete previous thumbnails and variants which were replaced and are
+        not used by any image anymore. Derived files are shared by the images
+        of the same original, originals are the names of those originals.
+        """
+        new_names = {
+            image.pk: derived_names(image.thumbnail.name, image.variants)
+            for image in updated
+        }
+        replaced = set()
+        for pk, _name, thumbnail, variants, _image_type in rows:
+            if pk in new_names:
+                replaced |= derived_names(thumbnail, variants) - new_names[pk]
+        if not replaced:
+            return
+        in_use = set()
+        for thumbnail, variants in WineImage.objects.filter(
+            Q(thumbnail__in=replaced) | Q(image__in=originals)
+        ).values_list("thumbnail", "variants"):
+            in_use |= derived_names(thumbnail, variants)
+        for name in replaced - in_use:
+            default_storage.delete(name)
+
+    @staticmethod
+    def read_checkpoint(path, filters):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            data = json.load(f)
+        if data["filters"] != filters:
+            raise CommandError(
+                f"Checkpoint {path} was created with different filters "
+                f"({data['filters']}), use --restart to discard it."
+            )
+        return data["last_pk"]
+
+    @staticmethod
+    def write_checkpoint(path, filters, last_pk):
+        # write to a temporary file first so an interrupt can't corrupt it
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"filters": filters, "last_pk": last_pk}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wine", "0015_wineimage_image_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wineimage",
+            name="variants",
+            field=models.JSONField(blank=True, default=list, verbose_name="Variants"),
+        ),
+    ]
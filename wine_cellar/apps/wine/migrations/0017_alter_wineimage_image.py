@@ -0,0 +1,26 @@
+# Generated by Django 5.2.9 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+import wine_cellar.apps.wine.storage
+import wine_cellar.apps.wine.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wine", "0016_wineimage_variants"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="wineimage",
+            name="image",
+            field=models.ImageField(
+                db_index=True,
+                storage=wine_cellar.apps.wine.storage.get_content_storage,
+                upload_to=wine_cellar.apps.wine.utils.content_addressed_path,
+                verbose_name="Image",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.9 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wine", "0017_alter_wineimage_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wineimage",
+            name="phash",
+            field=models.BigIntegerField(
+                blank=True, db_index=True, null=True, verbose_name="Perceptual Hash"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wine", "0018_wineimage_phash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wineimage",
+            name="placeholder",
+            field=models.TextField(blank=True, default="", verbose_name="Placeholder"),
+        ),
+    ]
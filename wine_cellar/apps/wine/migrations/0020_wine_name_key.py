@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-19 19:30
+
+from django.db import migrations, models
+
+from wine_cellar.apps.wine.utils import normalize_name
+
+
+def fill_name_keys(apps, schema_editor):
+    Wine = apps.get_model("wine", "Wine")
+    wines = []
+    for wine in Wine.objects.only("pk", "name").iterator(chunk_size=1000):
+        wine.name_key = normalize_name(wine.name)[:100]
+        wines.append(wine)
+    Wine.objects.bulk_update(wines, ["name_key"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wine", "0019_wineimage_placeholder"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wine",
+            name="name_key",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_name_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.9 on 2026-10-19 20:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wine", "0020_wine_name_key"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DrinkByReminder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("drink_by", models.DateField(verbose_name="Drink By")),
+                (
+                    "horizon",
+                    models.PositiveSmallIntegerField(verbose_name="Days before"),
+                ),
+                ("sent", models.DateTimeField(auto_now_add=True, verbose_name="Sent")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="User",
+                    ),
+                ),
+                (
+                    "wine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="wine.wine",
+                        verbose_name="Wine",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Drink By Reminder",
+                "verbose_name_plural": "Drink By Reminders",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("wine", "drink_by", "horizon"),
+                        name="unique drink by reminder",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.9 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wine", "0021_drinkbyreminder"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="wine",
+            name="name_key",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=100
+            ),
+        ),
+    ]
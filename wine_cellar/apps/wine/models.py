@@ -11,7 +11,12 @@ from django.utils.formats import number_format
 from django.utils.translation import gettext_lazy as _
 
 from wine_cellar.apps.user.views import get_user_settings
-from wine_cellar.apps.wine.utils import user_directory_path
+from wine_cellar.apps.wine.storage import get_content_storage
+from wine_cellar.apps.wine.utils import (
+    content_addressed_path,
+    normalize_name,
+    user_directory_path,
+)
 
 
 class UserContentModel(models.Model):
@@ -62,6 +67,10 @@ class ImageType(models.TextChoices):
     LABEL_BACK = "LB", _("Label Back")
 
 
+# image types which are hashed to find wines by a photo of their label
+LABEL_IMAGE_TYPES = [ImageType.FRONT, ImageType.LABEL_FRONT]
+
+
 class Size(UserContentModel):
     name = models.FloatField(verbose_name=_("Size"))
 
@@ -174,6 +183,10 @@ class Source(UserContentModel):
 
 class Wine(UserContentModel):
     name = models.CharField(max_length=100, verbose_name=_("Name"))
+    # normalized name to find possible duplicates, see normalize_name
+    name_key = models.CharField(
+        max_length=100, blank=True, editable=False, db_index=True
+    )
     barcode = models.CharField(max_length=100, null=True, verbose_name=_("Barcode"))
     wine_type = models.CharField(max_length=2, choices=WineType, verbose_name=_("Type"))
     category = models.CharField(max_length=2, choices=Category, null=True, verbose_name=_("Category"))
@@ -239,13 +252,19 @@ class Wine(UserContentModel):
         currency = settings.CURRENCY_SYMBOLS.get(
             getattr(user_settings, "currency", "EUR"), "€"
         )
-        avg_price = self.storageitem_set.aggregate(avg_price=models.Avg("price"))[
-            "avg_price"
-        ]
+        # consumed bottles moved to the archive keep counting
+        total, count = Decimal(0), 0
+        for items in (self.storageitem_set, self.archivedstorageitem_set):
+            prices = items.aggregate(
+                total=models.Sum("price"), count=models.Count("price")
+            )
+            if prices["count"]:
+                total += prices["total"]
+                count += prices["count"]
 
-        if avg_price is None:
+        if not count:
             return None
-        avg_price = avg_price.quantize(Decimal("0.00"))
+        avg_price = (total / count).quantize(Decimal("0.00"))
         formatted_price = number_format(avg_price, use_l10n=True)
         return f"{formatted_price}{currency}"
 
@@ -275,21 +294,25 @@ class Wine(UserContentModel):
         i = self.wineimage_set.first()
         if not i:
             return static(settings.DEFAULT_WINE_IMAGE)
+        if i.variants:
+            # largest variant instead of the full size original
+            return i.get_variant_url("jpeg", max)
         return i.image.url
 
+    @property
+    def front_image(self):
+        return self.wineimage_set.filter(image_type=ImageType.FRONT).first()
+
     @property
     def image_thumbnail(self):
-        i = self.wineimage_set.filter(image_type=ImageType.FRONT)
-        if not i:
+        front = self.front_image
+        if not front:
             return static(settings.DEFAULT_WINE_IMAGE)
-        front = i.first()
-        if front.thumbnail:
-            return front.thumbnail.url
-        # return normal image as fallback
-        return front.image.url
+        return front.thumbnail_url
 
     @property
     def image_thumbnails(self):
+        """Sources of all images as dicts with src, srcset, webp_srcset and aspect."""
         images = {img.image_type: img for img in self.wineimage_set.all()}
         order = [
             ImageType.FRONT,
@@ -301,10 +324,16 @@ class Wine(UserContentModel):
         for image_type in order:
             image = images.get(image_type)
             if image:
-                src = image.thumbnail.url if image.thumbnail else image.image.url
-                result.append(src)
+                result.append(image.sources)
         return result
 
+    def save(self, *args, **kwargs):
+        self.name_key = normalize_name(self.name)[:100]
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "name" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "name_key"}
+        super().save(*args, **kwargs)
+
     @property
     def country_name(self):
         return pycountry.countries.get(alpha_2=self.country).name
@@ -332,15 +361,110 @@ class Wine(UserContentModel):
         ]
 
 
+class DrinkByReminder(models.Model):
+    """
+    A drink by reminder sent for a wine, recorded so every reminder is sent
+    only once even if the reminder task runs again.
+    """
+
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, verbose_name=_("User")
+    )
+    wine = models.ForeignKey(Wine, on_delete=models.CASCADE, verbose_name=_("Wine"))
+    # the drink by date the reminder was sent for, a changed date is reminded again
+    drink_by = models.DateField(verbose_name=_("Drink By"))
+    horizon = models.PositiveSmallIntegerField(verbose_name=_("Days before"))
+    sent = models.DateTimeField(auto_now_add=True, verbose_name=_("Sent"))
+
+    class Meta:
+        verbose_name = _("Drink By Reminder")
+        verbose_name_plural = _("Drink By Reminders")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["wine", "drink_by", "horizon"],
+                name="unique drink by reminder",
+            )
+        ]
+
+
 class WineImage(models.Model):
-    image = models.ImageField(upload_to=user_directory_path, verbose_name=_("Image"))
+    image = models.ImageField(
+        upload_to=content_addressed_path,
+        storage=get_content_storage,
+        db_index=True,
+        verbose_name=_("Image"),
+    )
     thumbnail = models.ImageField(upload_to=user_directory_path, blank=True, null=True, verbose_name=_("Thumbnail"))
     wine = models.ForeignKey(Wine, on_delete=models.CASCADE, verbose_name=_("Wine"))
     user = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL, null=True, verbose_name=_("User"))
     image_type = models.CharField(
         max_length=3, choices=ImageType, default=ImageType.FRONT, verbose_name=_("Image Type")
     )
+    variants = models.JSONField(default=list, blank=True, verbose_name=_("Variants"))
+    placeholder = models.TextField(
+        blank=True, default="", verbose_name=_("Placeholder")
+    )
+    phash = models.BigIntegerField(
+        null=True, blank=True, db_index=True, verbose_name=_("Perceptual Hash")
+    )
 
     class Meta:
         verbose_name = _("Wine Image")
         verbose_name_plural = _("Wine Images")
+
+    @property
+    def thumbnail_url(self):
+        if self.thumbnail:
+            return self.thumbnail.url
+        # return normal image as fallback
+        return self.image.url
+
+    @property
+    def needs_processing(self):
+        """Whether derived images or the label hash still have to be made."""
+        if not self.image:
+            return False
+        needs_phash = self.image_type in LABEL_IMAGE_TYPES and self.phash is None
+        return needs_phash or not (
+            self.thumbnail and self.variants and self.placeholder
+        )
+
+    @property
+    def aspect(self):
+        if not self.variants:
+            return None
+        return self.variants[0]["width"] / self.variants[0]["height"]
+
+    def get_variant_url(self, image_format, pick=min):
+        variants = [v for v in self.variants if v["format"] == image_format]
+        if not variants:
+            return None
+        variant = pick(variants, key=lambda v: v["width"])
+        return self.image.storage.url(variant["name"])
+
+    def get_srcset(self, image_format):
+        """Return a srcset attribute value for the variants of the given format."""
+        storage = self.image.storage
+        return ", ".join(
+            f"{storage.url(v['name'])} {v['width']}w"
+            for v in self.variants
+            if v["format"] == image_format
+        )
+
+    @property
+    def srcset(self):
+        return self.get_srcset("jpeg")
+
+    @property
+    def webp_srcset(self):
+        return self.get_srcset("webp")
+
+    @property
+    def sources(self):
+        return {
+            "src": self.thumbnail_url,
+            "srcset": self.srcset,
+            "webp_srcset": self.webp_srcset,
+            "aspect": self.aspect,
+            "placeholder": self.placeholder,
+        }
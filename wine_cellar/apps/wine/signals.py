@@ -1,18 +1,57 @@
 from typing import Any
 
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
-from wine_cellar.apps.wine.models import WineImage
-from wine_cellar.apps.wine.utils import make_thumbnail
+from wine_cellar.apps.wine.duplicates import invalidate_name_index
+from wine_cellar.apps.wine.models import Wine, WineImage
+from wine_cellar.apps.wine.tasks import generate_thumbnail
+from wine_cellar.apps.wine.utils import delete_derived_files
 
 
 @receiver(post_save, sender=WineImage)
-def generate_thumbnail(
+def queue_thumbnail(
     sender: type[WineImage], instance: WineImage, **kwargs: Any
 ) -> None:
-    """Generate thumbnail for wine images after save."""
-    if instance.image and not instance.thumbnail:
-        thumb_name = make_thumbnail(instance)
-        instance.thumbnail.name = thumb_name
-        instance.save(update_fields=["thumbnail"])
+    """Queue thumbnail generation for wine images once the save is committed."""
+    if instance.needs_processing:
+        transaction.on_commit(lambda: generate_thumbnail.delay(instance.pk))
+
+
+@receiver(post_delete, sender=WineImage)
+def delete_unused_files(
+    sender: type[WineImage], instance: WineImage, **kwargs: Any
+) -> None:
+    """Delete the files of a wine image once no other image references them."""
+    name = instance.image.name
+    if not name:
+        return
+
+    def delete():
+        is_used = WineImage.objects.filter(image=name).exists
+        if instance.image.storage.delete_unused(name, is_used):
+            delete_derived_files(instance.thumbnail.name, instance.variants)
+
+    transaction.on_commit(delete)
+
+
+# fields of a wine stored in the name index of duplicates.py
+NAME_INDEX_FIELDS = {"name", "vintage"}
+
+
+@receiver(post_save, sender=Wine)
+@receiver(post_delete, sender=Wine)
+@receiver(m2m_changed, sender=Wine.vineyard.through)
+def update_name_index(sender: type, instance: Any, **kwargs: Any) -> None:
+    """Invalidate the name index of the user once the change is committed."""
+    if kwargs["signal"] is m2m_changed:
+        if kwargs["action"] not in ("post_add", "post_remove", "post_clear"):
+            return
+    elif kwargs["signal"] is post_save:
+        update_fields = kwargs["update_fields"]
+        if update_fields is not None and not NAME_INDEX_FIELDS & update_fields:
+            return
+    # the instance is a wine or, for the reverse relation, a vineyard
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_name_index(user_id))
@@ -0,0 +1,95 @@
+import os
+import secrets
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from wine_cellar.apps.wine.storage import content_storage, file_hash
+
+STAGING_DIR = "staging"
+SESSION_KEY = "staged_uploads"
+
+
+def _staged_uploads(request) -> dict:
+    """Return the staged uploads of the session, dropping the expired ones."""
+    uploads = request.session.get(SESSION_KEY, {})
+    now = time.time()
+    live = {
+        token: upload for token, upload in uploads.items() if upload["expires"] >= now
+    }
+    if len(live) != len(uploads):
+        request.session[SESSION_KEY] = live
+    return live
+
+
+def stage_upload(request, file) -> str:
+    """
+    Store a validated upload in the staging area and remember it in the
+    session. Returns the token later steps of a form use to refer to it.
+    """
+    token = secrets.token_urlsafe(16)
+    content_hash = file_hash(file)
+    _base, ext = os.path.splitext(file.name)
+    name = content_storage.save(f"{STAGING_DIR}/{token}{ext.lower()}", file)
+    uploads = _staged_uploads(request)
+    uploads[token] = {
+        "name": name,
+        "hash": content_hash,
+        "expires": time.time() + settings.WINE_UPLOAD_STAGING_TTL,
+    }
+    request.session[SESSION_KEY] = uploads
+    return token
+
+
+def get_staged_upload(request, token):
+    """
+    Return the staged upload of a token, None if it is unknown, expired or
+    its file was deleted by clean_staged_uploads.
+    """
+    upload = _staged_uploads(request).get(token)
+    if upload and content_storage.exists(upload["name"]):
+        return upload
+    return None
+
+
+def attach_staged_upload(request, token, user) -> str:
+    """
+    Return the content addressed name of a staged upload for an image of
+    user. The file is moved there, not read again, once the current
+    transaction is committed, so a failed save leaves it staged.
+    """
+    upload = _staged_uploads(request)[token]
+    _base, ext = os.path.splitext(upload["name"])
+    name = f"user_{user.pk}/{upload['hash']}{ext}"
+
+    def attach():
+        request.session[SESSION_KEY].pop(token, None)
+        request.session.modified = True
+        with content_storage.lock():
+            if content_storage.exists(name):
+                content_storage.delete(upload["name"])
+            else:
+                path = content_storage.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(content_storage.path(upload["name"]), path)
+
+    transaction.on_commit(attach)
+    return name
+
+
+def clean_staged_uploads(max_age=None) -> int:
+    """Delete staged files older than max_age seconds, return their number."""
+    if max_age is None:
+        max_age = settings.WINE_UPLOAD_STAGING_TTL
+    if not content_storage.exists(STAGING_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    deleted = 0
+    _dirs, files = content_storage.listdir(STAGING_DIR)
+    for file in files:
+        name = f"{STAGING_DIR}/{file}"
+        if content_storage.get_modified_time(name).timestamp() < cutoff:
+            content_storage.delete(name)
+            deleted += 1
+    return deleted
@@ -0,0 +1,104 @@
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Storage for files named after a hash of their content.
+
+    A file with the same name already has the same content, so it is reused
+    instead of being stored again under a randomized name. Files are shared,
+    so checking whether a file exists and writing or deleting it happen
+    while holding a lock, see lock.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    @contextmanager
+    def lock(self):
+        """Exclusive lock shared by all processes using the storage."""
+        os.makedirs(self.location, exist_ok=True)
+        with open(os.path.join(self.location, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _save(self, name, content):
+        with self.lock():
+            if self.exists(name):
+                return name
+            return super()._save(name, content)
+
+    def delete_unused(self, name, is_used) -> bool:
+        """
+        Delete a file unless is_used() returns True, which is called while
+        holding the lock. Returns whether the file was deleted.
+        """
+        with self.lock():
+            if is_used():
+                return False
+            self.delete(name)
+            return True
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage():
+    return content_storage
+
+
+def file_hash(file) -> str:
+    """
+    Return the SHA-256 hex digest of a file. Uses the digest computed while
+    uploading if available, otherwise the file is read in chunks.
+    """
+    content_hash = getattr(file, "content_hash", None)
+    if content_hash:
+        return content_hash
+    sha = hashlib.sha256()
+    for chunk in file.chunks():
+        sha.update(chunk)
+    file.seek(0)
+    return sha.hexdigest()
+
+
+class HashingUploadHandlerMixin:
+    """Compute the SHA-256 of uploaded files while they are streamed in."""
+
+    def new_file(self, *args, **kwargs):
+        self.sha = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.sha.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(
+    HashingUploadHandlerMixin, MemoryFileUploadHandler
+):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(
+    HashingUploadHandlerMixin, TemporaryFileUploadHandler
+):
+    pass
@@ -1,25 +1,239 @@
-from datetime import timedelta
+from datetime import date, timedelta
+from itertools import groupby
+from operator import attrgetter
 
 from celery import shared_task
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, OuterRef, Q
 from django.utils import timezone
 
-from wine_cellar.apps.wine.emails import send_drink_by_reminder
-from wine_cellar.apps.wine.models import Wine
+from wine_cellar.apps.user.models import (
+    DEFAULT_REMINDER_DAYS,
+    UserSettings,
+    parse_reminder_days,
+)
+from wine_cellar.apps.wine import emails, staging
+from wine_cellar.apps.wine.label_index import invalidate_label_index
+from wine_cellar.apps.wine.models import (
+    LABEL_IMAGE_TYPES,
+    DrinkByReminder,
+    Wine,
+    WineImage,
+)
+from wine_cellar.apps.wine.storage import content_storage
+from wine_cellar.apps.wine.utils import (
+    THUMBNAIL_HEIGHT,
+    dhash,
+    ingest_image,
+    load_image,
+    make_placeholder,
+    make_thumbnail,
+    make_variants,
+)
+
+
+def reminder_horizons():
+    """All reminder horizons (days before the drink by date) of any user."""
+    horizons = set(parse_reminder_days(DEFAULT_REMINDER_DAYS))
+    for value in (
+        UserSettings.objects.filter(notifications=True)
+        .values_list("reminder_days", flat=True)
+        .distinct()
+    ):
+        horizons.update(parse_reminder_days(value))
+    return sorted(horizons)
+
+
+def due_wines(today, horizons):
+    """
+    Wines in stock of users who want to be notified whose drink by date is
+    within one of their reminder horizons and whose reminder for that
+    horizon wasn't sent yet. The number of bottles in stock is annotated as
+    stock and, for every horizon, whether its reminder was sent as
+    reminded_<horizon>.
+    """
+    annotations = {}
+    due = Q(pk__in=[])
+    for horizon in horizons:
+        reminded = f"reminded_{horizon}"
+        annotations[reminded] = Exists(
+            DrinkByReminder.objects.filter(
+                wine=OuterRef("pk"), drink_by=OuterRef("drink_by"), horizon=horizon
+            )
+        )
+        # reminder_days is stored normalized, e.g. "3,14"
+        has_horizon = Q(
+            user__user_settings__reminder_days__regex=rf"(^|,){horizon}(,|$)"
+        )
+        if horizon in parse_reminder_days(DEFAULT_REMINDER_DAYS):
+            has_horizon |= Q(user__user_settings__isnull=True)
+        due |= (
+            Q(drink_by__lte=today + timedelta(days=horizon))
+            & has_horizon
+            & Q(**{reminded: False})
+        )
+    return (
+        Wine.objects.filter(
+            drink_by__range=(today, today + timedelta(days=max(horizons, default=0))),
+            user__email__isnull=False,
+        )
+        .exclude(user__email="")
+        .exclude(user__user_settings__notifications=False)
+        .annotate(**annotations)
+        .filter(due)
+        .annotate(stock=Count("storageitem", filter=Q(storageitem__deleted=False)))
+        .filter(stock__gt=0)
+    )
 
 
 @shared_task(name="drink_by_reminder")
 def drink_by_reminder():
-    User = get_user_model()
-    users = (
-        User.objects.exclude(email__isnull=True)
-        .exclude(email__exact="")
-        .exclude(user_settings__notifications=False)
+    """
+    Remind users of wines to drink soon. Reminders which were missed, e.g.
+    because the task didn't run on a day, are sent by the next run.
+    """
+    today = timezone.now().date()
+    # reminders of past drink by dates are not needed to skip anything anymore
+    DrinkByReminder.objects.filter(drink_by__lt=today).delete()
+    horizons = reminder_horizons()
+    user_ids = list(
+        due_wines(today, horizons)
+        .order_by("user_id")
+        .values_list("user_id", flat=True)
+        .distinct()
     )
-    date = timezone.now().date() + timedelta(days=14)
-    for user in users:
-        wines = Wine.objects.filter(
-            user=user, drink_by=date, storageitem__isnull=False
-        ).distinct()
-        if wines.count() > 0:
-            send_drink_by_reminder(user, wines)
+    batch_size = settings.WINE_REMINDER_BATCH_SIZE
+    for i in range(0, len(user_ids), batch_size):
+        send_drink_by_reminders.delay(
+            user_ids[i : i + batch_size], today.isoformat(), horizons
+        )
+
+
+@shared_task(
+    name="send_drink_by_reminders",
+    autoretry_for=(IntegrityError, OSError),
+    retry_backoff=True,
+    max_retries=3,
+)
+def send_drink_by_reminders(user_ids, today, horizons):
+    """
+    Send the drink by reminders of a batch of users. The wines of all users
+    are loaded with one query and the emails sent over one connection. The
+    sent reminders are recorded together with sending each email, so a
+    retry only sends the missing ones.
+    """
+    today = date.fromisoformat(today)
+    wines = (
+        due_wines(today, horizons)
+        .filter(user_id__in=user_ids)
+        .select_related("user__user_settings")
+        .order_by("user_id", "name")
+    )
+    sent = 0
+    with get_connection() as connection:
+        for user, user_wines in groupby(wines, key=attrgetter("user")):
+            user_wines = list(user_wines)
+            try:
+                user_horizons = user.user_settings.reminder_horizons
+            except UserSettings.DoesNotExist:
+                user_horizons = parse_reminder_days(DEFAULT_REMINDER_DAYS)
+            reminders = [
+                DrinkByReminder(
+                    user=user, wine=wine, drink_by=wine.drink_by, horizon=horizon
+                )
+                for wine in user_wines
+                for horizon in user_horizons
+                # all horizons the wine is within, a late reminder covers
+                # the earlier ones too
+                if wine.drink_by <= today + timedelta(days=horizon)
+                and not getattr(wine, f"reminded_{horizon}", True)
+            ]
+            with transaction.atomic():
+                DrinkByReminder.objects.bulk_create(reminders)
+                emails.drink_by_reminder_message(user, user_wines, connection).send()
+            sent += 1
+    return sent
+
+
+def replace_original(old_name, new_name):
+    """
+    Point all images using the original old_name to new_name, e.g. its
+    ingested version, and delete the old file once no image uses it.
+    """
+    WineImage.objects.filter(image=old_name).update(image=new_name)
+    content_storage.delete_unused(
+        old_name, WineImage.objects.filter(image=old_name).exists
+    )
+
+
+@shared_task(
+    name="generate_thumbnail",
+    autoretry_for=(OSError,),
+    retry_backoff=True,
+    max_retries=3,
+)
+def generate_thumbnail(image_id):
+    """
+    Normalize the original of a wine image and create its thumbnail,
+    responsive variants, inline placeholder and, for label images, its
+    perceptual hash.
+    Safe to run more than once: only missing files are created and images
+    which were deleted in the meantime are skipped.
+    """
+    image = WineImage.objects.filter(pk=image_id).first()
+    if not image or not image.needs_processing:
+        return
+    is_label = image.image_type in LABEL_IMAGE_TYPES
+    # images are stored by content, reuse the work done for the same file
+    shared = (
+        WineImage.objects.filter(image=image.image.name)
+        .exclude(pk=image_id)
+        .exclude(
+            Q(thumbnail__isnull=True)
+            | Q(thumbnail="")
+            | Q(variants=[])
+            | Q(placeholder="")
+        )
+    )
+    if is_label:
+        shared = shared.filter(phash__isnull=False)
+    shared = shared.first()
+    if shared:
+        fields = {
+            "thumbnail": shared.thumbnail.name,
+            "variants": shared.variants,
+            "placeholder": shared.placeholder,
+        }
+        if is_label:
+            fields["phash"] = shared.phash
+    else:
+        original = image.image.name
+        if ingest_image(image):
+            replace_original(original, image.image.name)
+        # decode only as much of the original as the largest output needs
+        img = load_image(
+            image, (max(settings.WINE_IMAGE_VARIANT_WIDTHS), THUMBNAIL_HEIGHT)
+        )
+        fields = {}
+        if not image.thumbnail:
+            fields["thumbnail"] = make_thumbnail(image, img=img)
+        if not image.variants:
+            fields["variants"] = make_variants(image, img=img)
+        if not image.placeholder:
+            fields["placeholder"] = make_placeholder(image, img=img)
+        if is_label and image.phash is None:
+            fields["phash"] = dhash(img)
+    # only store the result if the image was not replaced in the meantime
+    updated = WineImage.objects.filter(pk=image_id, image=image.image.name).update(
+        **fields
+    )
+    if updated and "phash" in fields and image.user_id:
+        invalidate_label_index(image.user_id)
+
+
+@shared_task(name="clean_staged_uploads")
+def clean_staged_uploads():
+    """Delete photos of wine forms which were never finished."""
+    return staging.clean_staged_uploads()
@@ -2,6 +2,7 @@ import json
 
 from django import template
 from django.conf import settings
+from django.templatetags.static import static
 from django.utils.html import format_html
 
 from wine_cellar.apps.wine.models import Wine
@@ -10,12 +11,18 @@ register = template.Library()
 
 
 def wine_to_json(wine: Wine):
+    front = wine.front_image
+    sources = front.sources if front else {}
     feature = {
         "name": wine.name,
         "country": wine.country,
         "country_name": wine.country_name,
         "country_icon": wine.country_icon,
-        "image": wine.image_thumbnail,
+        "image": sources.get("src", static(settings.DEFAULT_WINE_IMAGE)),
+        "image_srcset": sources.get("srcset", ""),
+        "image_webp_srcset": sources.get("webp_srcset", ""),
+        "image_aspect": sources.get("aspect"),
+        "image_placeholder": sources.get("placeholder", ""),
         "vintage": wine.vintage,
         "url": wine.get_absolute_url(),
     }
@@ -0,0 +1,37 @@
+from django import template
+from django.conf import settings
+from django.forms.utils import flatatt
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag()
+def wine_picture(image, height, **attrs):
+    """Render a WineImage as <picture> with WebP and JPEG srcsets.
+
+    The sizes attribute is derived from the display height and the aspect
+    ratio of the image, so the browser picks the smallest fitting variant.
+    Extra keyword arguments are rendered as attributes of the <img>.
+    The inline placeholder of the image is shown as background with the
+    final size until the thumbnail has loaded.
+    """
+    attrs["height"] = height
+    if not image:
+        attrs["src"] = static(settings.DEFAULT_WINE_IMAGE)
+        return format_html("<img{}>", flatatt(attrs))
+    attrs["src"] = image.thumbnail_url
+    if image.placeholder:
+        attrs["style"] = f"background: center / cover url({image.placeholder})"
+    if not image.variants:
+        return format_html("<picture><img{}></picture>", flatatt(attrs))
+    width = round(height * image.aspect)
+    sizes = f"{width}px"
+    attrs.update({"srcset": image.srcset, "sizes": sizes, "width": width})
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}"><img{}></picture>',
+        image.webp_srcset,
+        sizes,
+        flatatt(attrs),
+    )
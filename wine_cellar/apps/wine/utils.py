@@ -1,51 +1,303 @@
+import base64
+import hashlib
+import io
 import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
 from typing import TYPE_CHECKING
 
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from PIL import ExifTags, Image
 
+from wine_cellar.apps.wine.storage import file_hash
+
 if TYPE_CHECKING:
     from wine_cellar.apps.wine.models import WineImage
 
+THUMBNAIL_HEIGHT = 225
+# width (px) of the inline placeholder shown until the thumbnail is loaded
+PLACEHOLDER_WIDTH = 16
+
+# Image.transpose operation for each EXIF orientation value
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+SWAPS_AXES = {
+    Image.Transpose.TRANSPOSE,
+    Image.Transpose.ROTATE_270,
+    Image.Transpose.TRANSVERSE,
+    Image.Transpose.ROTATE_90,
+}
+
+# formats of uploaded originals which are normalized on ingest
+INGEST_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+# abbreviations in wine names which are expanded before comparing names
+NAME_ABBREVIATIONS = {"ch": "chateau", "st": "saint", "ste": "sainte", "dom": "domaine"}
+
+# file format and extension of the generated image variants
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+
+
+class LRUCache:
+    """A thread safe dict of at most maxsize entries, the least recently used go."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value) -> None:
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+
+def normalize_name(name: str) -> str:
+    """
+    Return the key of a wine name used to find duplicates: without accents,
+    case and punctuation and with common abbreviations expanded, so
+    "Ch. Margaux" and "Château Margaux" have the same key.
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c)).casefold()
+    words = re.findall(r"[^\W_]+", name)
+    return " ".join(NAME_ABBREVIATIONS.get(word, word) for word in words)
+
 
 def user_directory_path(instance: "WineImage", filename: str) -> str:
     """Generate upload path for user files."""
     return f"user_{instance.user.pk}/{filename}"
 
 
-def make_thumbnail(instance: "WineImage", height: int = 225) -> str:
+def content_addressed_path(instance: "WineImage", filename: str) -> str:
+    """Generate upload path for user images named after their content hash."""
+    _base, ext = os.path.splitext(filename)
+    content_hash = file_hash(instance.image.file)
+    return f"user_{instance.user.pk}/{content_hash}{ext.lower()}"
+
+
+def open_image(path: str, size: tuple[int, int] | None = None) -> Image.Image:
     """
-    Creates a proportional thumbnail with given height.
-    Returns the path to the thumbnail file.
+    Open an image and rotate it according to its EXIF orientation.
+    If size is given, JPEGs are decoded at a reduced scale (draft mode)
+    which is still at least as large as size after rotation.
+    """
+    img = Image.open(path)
+    transpose = EXIF_TRANSPOSE.get(img.getexif().get(ExifTags.Base.Orientation))
+    if size and img.format == "JPEG":
+        if transpose in SWAPS_AXES:
+            size = (size[1], size[0])
+        img.draft("RGB", size)
+    if transpose is not None:
+        img = img.transpose(transpose)
+    return img
+
+
+def load_image(
+    instance: "WineImage", size: tuple[int, int] | None = None
+) -> Image.Image:
+    """Open the original image of a WineImage, see open_image."""
+    return open_image(os.path.join(settings.MEDIA_ROOT, instance.image.name), size)
+
+
+def downscale(
+    img: Image.Image, size: tuple[int, int], reducing_gap: float | None = 3.0
+) -> Image.Image:
+    """
+    Resize an image to size. With a reducing_gap the image is first shrunk
+    by an integer factor using the cheap reduce() before the final LANCZOS
+    resample, which is considerably faster for large downscaling factors.
+    """
+    return img.resize(size, Image.LANCZOS, reducing_gap=reducing_gap)
+
+
+def ingest_image(instance: "WineImage") -> bool:
     """
-    image_path = instance.image.name
-    full_path = os.path.join(settings.MEDIA_ROOT, image_path)
-    img = Image.open(full_path)
-
-    try:
-        for orientation in ExifTags.TAGS.keys():
-            if ExifTags.TAGS[orientation] == "Orientation":
-                break
-        exif = img._getexif()
-        if exif:
-            orientation_value = exif.get(orientation)
-            if orientation_value == 3:
-                img = img.rotate(180, expand=True)
-            elif orientation_value == 6:
-                img = img.rotate(270, expand=True)
-            elif orientation_value == 8:
-                img = img.rotate(90, expand=True)
-    except (AttributeError, KeyError, IndexError):
-        # Image has no EXIF or orientation info
-        pass
-
-    aspect = img.width / img.height
-    width = int(height * aspect)
-
-    img.thumbnail((width, height), Image.LANCZOS)
-    base, ext = os.path.splitext(image_path)
-    name = f"{base}_thumb{ext}"
-    thumb_full_path = os.path.join(settings.MEDIA_ROOT, name)
-
-    img.save(thumb_full_path, format=img.format, quality=100)
+    Normalize the stored original of a WineImage: apply the EXIF orientation,
+    cap the longest edge at WINE_IMAGE_MAX_EDGE and strip metadata except the
+    color profile. The result is stored under the hash of its own content
+    and instance.image is changed to it, the previous file is kept for the
+    caller to replace, see tasks.replace_original. Returns whether the file
+    was rewritten, images which were already ingested are left untouched.
+    """
+    path = os.path.join(settings.MEDIA_ROOT, instance.image.name)
+    max_edge = settings.WINE_IMAGE_MAX_EDGE
+    with Image.open(path) as original:
+        image_format = original.format
+        too_large = max_edge and max(original.size) > max_edge
+        has_metadata = bool(original.getexif()) or "xmp" in original.info
+    if image_format not in INGEST_FORMATS or not (too_large or has_metadata):
+        return False
+
+    img = open_image(path, (max_edge, max_edge) if too_large else None)
+    if too_large:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS, reducing_gap=3.0)
+    if image_format == "JPEG" and img.mode not in ("RGB", "L", "CMYK"):
+        img = img.convert("RGB")
+    buffer = io.BytesIO()
+    img.save(
+        buffer,
+        format=image_format,
+        quality=settings.WINE_IMAGE_INGEST_QUALITY,
+        optimize=True,
+        icc_profile=img.info.get("icc_profile"),
+    )
+    content = buffer.getvalue()
+    directory, filename = os.path.split(instance.image.name)
+    _base, ext = os.path.splitext(filename)
+    name = os.path.join(directory, f"{hashlib.sha256(content).hexdigest()}{ext}")
+    instance.image.name = instance.image.storage.save(name, ContentFile(content))
+    return True
+
+
+def save_versioned(img: Image.Image, base: str, ext: str, **params) -> str:
+    """
+    Save an image as <base>.<digest>.<ext> below MEDIA_ROOT, where digest is
+    taken from the encoded file. Files with new content always get a new
+    name, so their URLs can be cached forever. Returns the path of the file.
+    """
+    buffer = io.BytesIO()
+    img.save(buffer, **params)
+    content = buffer.getvalue()
+    name = f"{base}.{hashlib.sha256(content).hexdigest()[:12]}.{ext}"
+    with open(os.path.join(settings.MEDIA_ROOT, name), "wb") as f:
+        f.write(content)
     return name
+
+
+def make_thumbnail(
+    instance: "WineImage",
+    height: int = THUMBNAIL_HEIGHT,
+    img: Image.Image | None = None,
+) -> str:
+    """
+    Creates a proportional JPEG thumbnail with given height.
+    Returns the path to the thumbnail file.
+    """
+    if img is None:
+        img = load_image(instance, (height, height))
+    if img.height > height:
+        width = max(1, round(height * img.width / img.height))
+        thumb = downscale(img, (width, height))
+    else:
+        thumb = img
+    base, _ext = os.path.splitext(instance.image.name)
+    return save_versioned(
+        thumb.convert("RGB"),
+        f"{base}_thumb",
+        "jpg",
+        format="JPEG",
+        quality=settings.WINE_IMAGE_QUALITY,
+    )
+
+
+def make_placeholder(instance: "WineImage", img: Image.Image | None = None) -> str:
+    """
+    Creates a tiny WebP of the image, a few hundred bytes as a data URI,
+    which is embedded inline and stretched as a blurry preview.
+    """
+    if img is None:
+        img = load_image(instance, (PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH))
+    height = max(1, round(PLACEHOLDER_WIDTH * img.height / img.width))
+    tiny = downscale(img.convert("RGB"), (PLACEHOLDER_WIDTH, height))
+    buffer = io.BytesIO()
+    tiny.save(buffer, format="WEBP", quality=30)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def make_variants(
+    instance: "WineImage",
+    widths: list[int] | None = None,
+    img: Image.Image | None = None,
+) -> list[dict]:
+    """
+    Creates downscaled WebP and JPEG variants of the image for every width.
+    Images are never upscaled. Returns a list of the created variants with
+    their width, height, format and path, ordered by width.
+    """
+    if widths is None:
+        widths = settings.WINE_IMAGE_VARIANT_WIDTHS
+    if img is None:
+        img = load_image(instance, (max(widths), 1))
+    widths = sorted({min(w, img.width) for w in widths}, reverse=True)
+    base, _ext = os.path.splitext(instance.image.name)
+
+    variants = []
+    resized = img if img.mode in ("RGB", "RGBA") else img.convert("RGBA")
+    for width in widths:
+        height = max(1, round(width * img.height / img.width))
+        # downscale from the previous (larger) variant to save work
+        if width < resized.width:
+            resized = downscale(resized, (width, height))
+        for image_format, (pil_format, ext) in VARIANT_FORMATS.items():
+            out = resized if pil_format == "WEBP" else resized.convert("RGB")
+            name = save_versioned(
+                out,
+                f"{base}_{width}w",
+                ext,
+                format=pil_format,
+                quality=settings.WINE_IMAGE_QUALITY,
+            )
+            variants.append(
+                {
+                    "width": width,
+                    "height": height,
+                    "format": image_format,
+                    "name": name,
+                }
+            )
+    variants.sort(key=lambda v: v["width"])
+    return variants
+
+
+def derived_names(thumbnail: str | None, variants: list[dict]) -> set[str]:
+    """Names of the thumbnail and variant files created for an image."""
+    return {name for name in [thumbnail, *(v["name"] for v in variants)] if name}
+
+
+def delete_derived_files(thumbnail: str | None, variants: list[dict]) -> None:
+    """Delete the thumbnail and variant files created for an image."""
+    for name in derived_names(thumbnail, variants):
+        default_storage.delete(name)
+
+
+def dhash(img: Image.Image) -> int:
+    """
+    Return the 64 bit difference hash of an image: each bit tells whether a
+    pixel of the 9x8 grayscale thumbnail is brighter than its right
+    neighbour. Similar images have hashes with a small hamming distance.
+    The hash is returned as a signed integer so it fits a BigIntegerField.
+    """
+    pixels = list(downscale(img.convert("L"), (9, 8)).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            value = value << 1 | (left > right)
+    return value - (1 << 64) if value >= 1 << 63 else value
@@ -4,24 +4,58 @@ from django.conf import settings
 from django.contrib.auth.decorators import login_not_required
 from django.db import connections, transaction
 from django.db.models import Avg, Q, Sum
+from django.db.models.fields.files import FieldFile
 from django.db.models.functions import Coalesce
 from django.forms import model_to_dict
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from django.utils.formats import number_format
-from django.views.generic import DeleteView, DetailView, FormView, TemplateView
+from django.utils.translation import gettext_lazy as _
+from django.views.generic import (
+    DeleteView,
+    DetailView,
+    FormView,
+    TemplateView,
+    View,
+)
 from django_filters.views import FilterView
 
 from wine_cellar.apps.storage.models import StorageItem
 from wine_cellar.apps.user.views import get_user_settings
+from wine_cellar.apps.wine.duplicates import find_duplicates
 from wine_cellar.apps.wine.filters import WineFilter
-from wine_cellar.apps.wine.forms import WineEditForm, WineForm, image_fields_map
+from wine_cellar.apps.wine.forms import (
+    LabelSearchForm,
+    WineEditForm,
+    WineForm,
+    image_fields_map,
+)
+from wine_cellar.apps.wine.label_index import find_wines_by_label
 from wine_cellar.apps.wine.models import Wine, WineImage
+from wine_cellar.apps.wine.staging import (
+    attach_staged_upload,
+    get_staged_upload,
+    stage_upload,
+)
+from wine_cellar.apps.wine.utils import dhash, open_image
 
 # Form step constants
 FINAL_FORM_STEP = 4
 
+# many to many relations edited in the wine forms
+WINE_RELATIONS = ["vineyard", "grapes", "food_pairings", "source", "attributes"]
+
+# decoding a label photo at this size is enough to hash it
+LABEL_HASH_SIZE = (256, 256)
+
+
+def has_changed(old, new):
+    # empty form fields are "" while the column may be NULL
+    if new == "":
+        return old not in (None, "")
+    return old != new
+
 
 class HomePageView(TemplateView):
     template_name = "homepage.html"
@@ -103,18 +137,85 @@ class WineCreateView(FormView):
         if form_step is None:
             form_step = FINAL_FORM_STEP
         if form_step == FINAL_FORM_STEP or "save_finish" in self.request.POST:
-            self.process_form_data(self.request.user, form.cleaned_data)
+            expired = self.expired_staged_images(form)
+            if expired:
+                for field_name in expired:
+                    form.add_error(
+                        field_name, _("The photo has expired, please add it again.")
+                    )
+                return self.form_invalid(form)
+            with transaction.atomic():
+                # staged photos are moved once the wine is saved
+                images = self.attach_staged_images(form)
+                cleaned_data = {**form.cleaned_data, **images}
+                self.process_form_data(self.request.user, cleaned_data)
             return super().form_valid(form)
         elif form_step < FINAL_FORM_STEP:
-            # Advance to next step by recreating form with updated step
-            data = self.request.POST.copy()
+            # Advance to next step by recreating form with updated step, the
+            # photos are staged and only their tokens are sent again
+            data = self.stage_images(form)
             data["form_step"] = form_step + 1
-            files = self.request.FILES
-            form = self.get_form_class()(data=data, files=files, user=self.request.user)
+            form = self.get_form_class()(data=data, user=self.request.user)
+            self.show_staged_images(form)
             return self.render_to_response(self.get_context_data(form=form))
 
         return super().form_invalid(form)
 
+    def form_invalid(self, form):
+        # keep the valid photos so they don't have to be uploaded again
+        form.data = self.stage_images(form)
+        self.show_staged_images(form)
+        return super().form_invalid(form)
+
+    def stage_images(self, form):
+        """Stage the valid uploaded photos, return the data with their tokens."""
+        data = form.data.copy()
+        for field_name in image_fields_map:
+            image = getattr(form, "cleaned_data", {}).get(field_name)
+            if image is False:
+                # the staged photo was cleared
+                data.pop(f"{field_name}_token", None)
+            elif image and field_name not in form.errors:
+                data[f"{field_name}_token"] = stage_upload(self.request, image)
+            elif not get_staged_upload(self.request, data.get(f"{field_name}_token")):
+                data.pop(f"{field_name}_token", None)
+        return data
+
+    def show_staged_images(self, form):
+        """Preview the staged photos in their fields."""
+        for field_name in image_fields_map:
+            token = form[f"{field_name}_token"].value()
+            upload = token and get_staged_upload(self.request, token)
+            if upload:
+                form.initial[field_name] = FieldFile(
+                    None, WineImage._meta.get_field("image"), upload["name"]
+                )
+
+    def staged_tokens(self, form):
+        """Return field name -> token of the staged photos to keep."""
+        tokens = {}
+        for field_name in image_fields_map:
+            token = form.cleaned_data.get(f"{field_name}_token")
+            # a new photo was uploaded or the staged one was cleared
+            if form.cleaned_data.get(field_name) is None and token:
+                tokens[field_name] = token
+        return tokens
+
+    def expired_staged_images(self, form):
+        """Return the fields whose staged photo expired or was cleaned up."""
+        return [
+            field_name
+            for field_name, token in self.staged_tokens(form).items()
+            if not get_staged_upload(self.request, token)
+        ]
+
+    def attach_staged_images(self, form):
+        """Return the names of staged photos which were not uploaded again."""
+        return {
+            field_name: attach_staged_upload(self.request, token, self.request.user)
+            for field_name, token in self.staged_tokens(form).items()
+        }
+
     @staticmethod
     @transaction.atomic
     def process_form_data(user, cleaned_data):
@@ -167,6 +268,34 @@ class WineCreateView(FormView):
                 )
 
 
+class WineDuplicatesView(View):
+    def get(self, request):
+        """Possible duplicates of the wine entered in the first wizard step."""
+        vintage = request.GET.get("vintage", "")
+        vineyards = request.GET.getlist("vineyard")
+        wine_ids = find_duplicates(
+            request.user,
+            request.GET.get("name", ""),
+            int(vintage) if vintage.isdigit() else None,
+            [int(pk) for pk in vineyards if pk.isdigit()],
+        )
+        wines = Wine.objects.filter(user=request.user).in_bulk(wine_ids)
+        return JsonResponse(
+            {
+                "wines": [
+                    {
+                        "id": wines[pk].pk,
+                        "name": wines[pk].name,
+                        "vintage": wines[pk].vintage,
+                        "url": reverse("wine-detail", kwargs={"pk": pk}),
+                    }
+                    for pk in wine_ids
+                    if pk in wines
+                ]
+            }
+        )
+
+
 class WineUpdateView(FormView):
     template_name = "wine_edit.html"
     form_class = WineEditForm
@@ -178,14 +307,23 @@ class WineUpdateView(FormView):
             kwargs["user"] = self.request.user
         return kwargs
 
+    def get_object(self):
+        # loaded once with its relations for the initial data and the diff
+        if not hasattr(self, "object"):
+            self.object = get_object_or_404(
+                Wine.objects.select_related("size").prefetch_related(*WINE_RELATIONS),
+                pk=self.kwargs["pk"],
+                user=self.request.user,
+            )
+        return self.object
+
     def get_initial(self):
         initial = super().get_initial()
-        wine = get_object_or_404(Wine, pk=self.kwargs["pk"], user=self.request.user)
-        initial.update(model_to_dict(wine))
+        initial.update(model_to_dict(self.get_object()))
         return initial
 
     def form_valid(self, form):
-        wine = get_object_or_404(Wine, pk=self.kwargs["pk"], user=self.request.user)
+        wine = self.get_object()
         self.process_form_data(wine, self.request.user, form.cleaned_data)
         self.success_url = reverse_lazy("wine-detail", kwargs={"pk": wine.pk})
         return super().form_valid(form)
@@ -193,55 +331,58 @@ class WineUpdateView(FormView):
     @staticmethod
     @transaction.atomic
     def process_form_data(wine, user, cleaned_data):
-        abv = cleaned_data["abv"]
-        size = cleaned_data["size"][0]
-        category = cleaned_data["category"]
-        barcode = cleaned_data["barcode"]
-        comment = cleaned_data["comment"]
-        country = cleaned_data["country"]
-        food_pairings = cleaned_data["food_pairings"]
-        source = cleaned_data["source"]
-        price = cleaned_data["price"]
-        vineyards = cleaned_data["vineyard"]
-        grapes = cleaned_data["grapes"]
-        name = cleaned_data["name"]
-        rating = cleaned_data["rating"]
-        vintage = cleaned_data["vintage"]
-        drink_by = cleaned_data["drink_by"]
-        wine_type = cleaned_data["wine_type"]
-        attributes = cleaned_data["attributes"]
-
-        wine.abv = abv
-        wine.size = size
-        wine.category = category
-        wine.comment = comment
-        wine.country = country
-        wine.name = name
-        wine.barcode = barcode
-        wine.rating = rating
-        wine.vintage = vintage
-        wine.drink_by = drink_by
-        wine.wine_type = wine_type
-        wine.price = price
-        wine.save()
-
-        wine.vineyard.set(vineyards)
-        wine.grapes.set(grapes)
-        wine.food_pairings.set(food_pairings)
-        wine.attributes.set(attributes)
-        wine.source.set(source)
-
+        """Save only the fields, relations and images which changed."""
+        values = {
+            "abv": cleaned_data["abv"],
+            "size": cleaned_data["size"][0],
+            "category": cleaned_data["category"],
+            "barcode": cleaned_data["barcode"],
+            "comment": cleaned_data["comment"],
+            "country": cleaned_data["country"],
+            "price": cleaned_data["price"],
+            "name": cleaned_data["name"],
+            "rating": cleaned_data["rating"],
+            "vintage": cleaned_data["vintage"],
+            "drink_by": cleaned_data["drink_by"],
+            "wine_type": cleaned_data["wine_type"],
+        }
+        changed = [
+            field
+            for field, value in values.items()
+            if has_changed(getattr(wine, field), value)
+        ]
+        for field in changed:
+            setattr(wine, field, values[field])
+
+        # the relations are prefetched by get_object
+        relations_changed = False
+        for relation in WINE_RELATIONS:
+            manager = getattr(wine, relation)
+            current = {obj.pk for obj in manager.all()}
+            new = {obj.pk for obj in cleaned_data[relation]}
+            if current - new:
+                manager.remove(*(current - new))
+            if new - current:
+                manager.add(*(new - current))
+            relations_changed |= current != new
+        # modified also marks relation edits
+        if changed or relations_changed:
+            wine.save(update_fields=[*changed, "modified"])
+
+        existing_images = {}
+        for image in WineImage.objects.filter(wine=wine, user=user):
+            existing_images.setdefault(image.image_type, []).append(image)
         for form_field, image_type in image_fields_map.items():
             image = cleaned_data.get(form_field)
-            existing_image = WineImage.objects.filter(
-                wine=wine, user=user, image_type=image_type
-            )
-            if image is False or not hasattr(image, "instance"):
-                if existing_image.exists():
-                    existing_image.first().image.delete()
-                    existing_image.delete()
-            if image and not hasattr(image, "instance"):
-                WineImage.objects.get_or_create(
+            # unchanged images are the initial value of the field
+            if hasattr(image, "instance"):
+                continue
+            existing = existing_images.get(image_type)
+            if existing:
+                # files are removed by the post_delete signal once unused
+                WineImage.objects.filter(pk__in=[i.pk for i in existing]).delete()
+            if image:
+                WineImage.objects.create(
                     image=image, wine=wine, user=user, image_type=image_type
                 )
 
@@ -273,8 +414,23 @@ class WineListView(FilterView):
         return qs.filter(user=self.request.user)
 
 
-class WineScanView(TemplateView):
+class WineScanView(FormView):
     template_name = "scan_wine.html"
+    form_class = LabelSearchForm
+
+    def form_valid(self, form):
+        """Find wines whose front label looks like the uploaded photo."""
+        photo = form.cleaned_data["image"]
+        photo.seek(0)
+        with open_image(photo, LABEL_HASH_SIZE) as img:
+            wine_ids = find_wines_by_label(self.request.user, dhash(img))
+        wines = Wine.objects.filter(user=self.request.user).in_bulk(wine_ids)
+        matches = [wines[pk] for pk in wine_ids if pk in wines]
+        if len(matches) == 1:
+            return redirect(reverse("wine-detail", kwargs={"pk": matches[0].pk}))
+        return self.render_to_response(
+            self.get_context_data(form=form, matches=matches, searched=True)
+        )
 
 
 class WineScannedView(TemplateView):
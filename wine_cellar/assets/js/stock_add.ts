@@ -1,8 +1,25 @@
 
-interface FreeCells {
-    [storageId: string]: {
-        [rows: string]: number[]
+interface StorageOccupancy {
+    rows: number
+    columns: number
+    // base64 encoded bitmap with one bit per cell row by row, set if occupied
+    occupied: string
+}
+
+interface Occupancy {
+    [storageId: string]: StorageOccupancy
+}
+
+function freeColumns(storage: StorageOccupancy, row: number): number[] {
+    const bitmap = Uint8Array.from(atob(storage.occupied), (c) => c.charCodeAt(0))
+    const free = []
+    for (let column = 1; column <= storage.columns; column++) {
+        const index = (row - 1) * storage.columns + column - 1
+        if (!(bitmap[index >> 3] & (1 << (index & 7)))) {
+            free.push(column)
+        }
     }
+    return free
 }
 
 function showWarning() {
@@ -20,9 +37,10 @@ function updateStorageCells() {
     const rowSelect = document.getElementById('id_row') as HTMLSelectElement
     const columnSelect = document.getElementById('id_column') as HTMLSelectElement
     const submitButton = document.getElementById('submit_button') as HTMLButtonElement
+    const autoPlace = document.getElementById('id_auto_place') as HTMLInputElement
 
     const storageData = document.getElementById('storage-data')!
-    const freeCells: FreeCells = JSON.parse(storageData.dataset.attributes || '{}')
+    const occupancy: Occupancy = JSON.parse(storageData.dataset.attributes || '{}')
 
     if (storageSelect) {
         storageSelect.addEventListener('change', updateRows)
@@ -33,6 +51,9 @@ function updateStorageCells() {
     if (columnSelect) {
         columnSelect.addEventListener('change', updateSubmit)
     }
+    if (autoPlace) {
+        autoPlace.addEventListener('change', updateRows)
+    }
 
     function toggleFields(disable: boolean, submit: boolean = false) {
         rowSelect.disabled = disable
@@ -77,8 +98,8 @@ function updateStorageCells() {
 
     function updateColumns() {
         const storageId = storageSelect.value
-        const rowId = rowSelect.value
-        const columns = freeCells[storageId][rowId]
+        const row = Number(rowSelect.value)
+        const columns = freeColumns(occupancy[storageId], row)
         if (columns.length > 0) {
             populateSelect(columnSelect, columns)
             hideWarning()
@@ -91,14 +112,19 @@ function updateStorageCells() {
 
     function updateRows() {
         const storageId = storageSelect.value
-        const rows = freeCells[storageId]
-        const unlimited_shelf = Object.keys(rows).length === 0
-        if (!unlimited_shelf) {
-            const rowKeys = Object.keys(rows).map(Number)
-            const hasRows = Array.isArray(rowKeys) && rowKeys.length > 0
-                populateSelect(rowSelect, rowKeys)
-                populateSelect(columnSelect, [])
-                toggleFields(false, false)
+        const storage = occupancy[storageId]
+        if (!storage) {
+            return
+        }
+        const unlimited_shelf = storage.rows === 0
+        if (autoPlace?.checked) {
+            // the server picks the next free slot
+            toggleFields(true, true)
+        } else if (!unlimited_shelf) {
+            const rows = Array.from({ length: storage.rows }, (_, i) => i + 1)
+            populateSelect(rowSelect, rows)
+            populateSelect(columnSelect, [])
+            toggleFields(false, false)
         } else {
             populateSelect(rowSelect, [])
             populateSelect(columnSelect, [])
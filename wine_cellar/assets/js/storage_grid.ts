@@ -0,0 +1,55 @@
+interface GridWine {
+    id: number
+    label: string
+    url: string
+    // id of the front image and the URL of its thumbnail
+    image: number | null
+    thumbnail: string | null
+}
+
+interface Grid {
+    rows: number
+    columns: number
+    wines: GridWine[]
+    // row-major pairs of wine index (1-based, 0 is a free slot) and run length
+    cells: number[]
+    unplaced: number
+}
+
+function renderGrid(container: HTMLElement, grid: Grid) {
+    container.style.setProperty('--columns', String(grid.columns))
+    const fragment = document.createDocumentFragment()
+    for (let i = 0; i < grid.cells.length; i += 2) {
+        const wine = grid.wines[grid.cells[i] - 1]
+        for (let run = 0; run < grid.cells[i + 1]; run++) {
+            if (!wine) {
+                const cell = document.createElement('span')
+                cell.className = 'storage-grid__cell'
+                fragment.appendChild(cell)
+                continue
+            }
+            const cell = document.createElement('a')
+            cell.className = 'storage-grid__cell storage-grid__cell--occupied'
+            cell.href = wine.url
+            cell.title = wine.label
+            if (wine.thumbnail) {
+                const img = document.createElement('img')
+                img.src = wine.thumbnail
+                img.alt = wine.label
+                img.loading = 'lazy'
+                cell.appendChild(img)
+            }
+            fragment.appendChild(cell)
+        }
+    }
+    container.replaceChildren(fragment)
+}
+
+document.addEventListener('DOMContentLoaded', async function () {
+    const container = document.getElementById('storage-grid')
+    if (!container || !container.dataset.url) return
+    const response = await fetch(container.dataset.url)
+    if (response.ok) {
+        renderGrid(container, await response.json())
+    }
+})
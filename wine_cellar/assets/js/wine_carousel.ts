@@ -1,16 +1,34 @@
+interface WineImageSources {
+    src: string
+    srcset: string
+    webp_srcset: string
+    aspect: number | null
+}
+
 document.addEventListener("DOMContentLoaded", function () {
     const wrapper = document.querySelector(".wine-detail__image-wrapper") as HTMLElement;
-    if (!wrapper) return;
+    const data = document.getElementById("wine-images");
+    if (!wrapper || !data) return;
 
-    const images = JSON.parse(wrapper.dataset.images || '');
+    const images: WineImageSources[] = JSON.parse(data.textContent || '[]');
     let index = 0;
 
     const imgEl = document.getElementById("wine-image") as HTMLImageElement;
     const prevBtn = wrapper.querySelector(".wine-prev") as HTMLButtonElement;
     const nextBtn = wrapper.querySelector(".wine-next") as HTMLButtonElement;
+    if (!prevBtn || !nextBtn) return;
 
     function updateImage() {
-        imgEl.src = images[index];
+        const image = images[index];
+        const sizes = image.aspect ? `${Math.round(imgEl.height * image.aspect)}px` : '';
+        const source = imgEl.parentElement?.querySelector("source");
+        if (source) {
+            source.srcset = image.webp_srcset;
+            source.sizes = sizes;
+        }
+        imgEl.srcset = image.srcset;
+        imgEl.sizes = sizes;
+        imgEl.src = image.src;
     }
 
     prevBtn.addEventListener("click", () => {
@@ -0,0 +1,58 @@
+interface DuplicateWine {
+    id: number
+    name: string
+    vintage: number | null
+    url: string
+}
+
+function renderDuplicates(container: HTMLElement, wines: DuplicateWine[]) {
+    const list = document.createElement('ul')
+    for (const wine of wines) {
+        const item = document.createElement('li')
+        const link = document.createElement('a')
+        link.href = wine.url
+        link.textContent = wine.vintage ? `${wine.name} (${wine.vintage})` : wine.name
+        item.appendChild(link)
+        list.appendChild(item)
+    }
+    container.classList.toggle('hidden', wines.length === 0)
+    container.querySelector('ul')?.remove()
+    container.appendChild(list)
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    const container = document.getElementById('wine-duplicates')
+    const name = document.getElementById('id_name') as HTMLInputElement | null
+    if (!container || !container.dataset.url || !name) return
+    let timeout: number | undefined
+    let controller: AbortController | undefined
+
+    async function search() {
+        const params = new URLSearchParams({ name: name!.value })
+        const vintage = document.getElementById('id_vintage') as HTMLInputElement | null
+        if (vintage?.value) params.set('vintage', vintage.value)
+        const vineyard = document.getElementById('id_vineyard') as HTMLSelectElement | null
+        for (const option of Array.from(vineyard?.selectedOptions ?? [])) {
+            params.append('vineyard', option.value)
+        }
+        // only the response to the latest keystroke is shown
+        controller?.abort()
+        controller = new AbortController()
+        try {
+            const response = await fetch(`${container!.dataset.url}?${params}`, {
+                signal: controller.signal,
+            })
+            if (response.ok) {
+                renderDuplicates(container!, (await response.json()).wines)
+            }
+        } catch (e) {
+            if (!(e instanceof DOMException && e.name === 'AbortError')) throw e
+        }
+    }
+
+    name.addEventListener('input', () => {
+        window.clearTimeout(timeout)
+        timeout = window.setTimeout(search, 200)
+    })
+    if (name.value) search()
+})
@@ -44,12 +44,34 @@ if EMAIL_HOST:
 
 CELERY_BROKER_URL = "redis://redis:6379"
 CELERY_RESULT_BACKEND = "redis://redis:6379"
+CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER", "False") == "True"
+
+# a cache shared by all processes, by default the redis celery uses. Tasks
+# running eagerly need no redis, the cache is then local to each process.
+CACHE_URL = os.environ.get(
+    "DJANGO_CACHE_URL", "" if CELERY_TASK_ALWAYS_EAGER else "redis://redis:6379/1"
+)
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
 
 CELERY_BEAT_SCHEDULE = {
     "drink_by_reminder": {
         "task": "drink_by_reminder",
         "schedule": crontab(minute="30", hour="2"),
     },
+    "clean_staged_uploads": {
+        "task": "clean_staged_uploads",
+        "schedule": crontab(minute="15"),
+    },
+    "archive_storage_items": {
+        "task": "archive_storage_items",
+        "schedule": crontab(minute="0", hour="3"),
+    },
 }
 
 SENTRY_DSN = os.environ.get("SENTRY_DSN", "")
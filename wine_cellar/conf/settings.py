@@ -100,6 +100,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": "db.sqlite3",
+        # take the write lock when a transaction starts, concurrent writers
+        # then wait for each other instead of failing to upgrade their lock
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
         "TEST": {
             "NAME": "test_db.sqlite3",
         },
@@ -178,9 +181,39 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_ROOT = "media/"
 MEDIA_URL = "media/"
 
+# Hash uploads while they are received so images can be stored by content
+FILE_UPLOAD_HANDLERS = [
+    "wine_cellar.apps.wine.storage.HashingMemoryFileUploadHandler",
+    "wine_cellar.apps.wine.storage.HashingTemporaryFileUploadHandler",
+]
+
 # Default image for wines without photos
 DEFAULT_WINE_IMAGE = "images/bottle.svg"
 
+# Widths (px) of the responsive WebP/JPEG variants created for wine images
+WINE_IMAGE_VARIANT_WIDTHS = [160, 320, 640, 1280]
+# Encoder quality used for thumbnails and variants
+WINE_IMAGE_QUALITY = 80
+# Longest edge (px) uploaded originals are downscaled to, None to keep the size
+WINE_IMAGE_MAX_EDGE = 2560
+# Encoder quality used when rewriting uploaded originals
+WINE_IMAGE_INGEST_QUALITY = 85
+# Minimum trigram similarity (0-1) of names to suggest a wine as a duplicate
+WINE_DUPLICATE_MIN_SIMILARITY = 0.5
+# Seconds photos uploaded in an unfinished wine form are kept in the staging area
+WINE_UPLOAD_STAGING_TTL = 6 * 60 * 60
+# Number of users whose drink by reminders are sent by one task
+WINE_REMINDER_BATCH_SIZE = 500
+# Maximum hamming distance of label hashes (0-64) to treat photos as the same wine
+WINE_LABEL_MAX_DISTANCE = 10
+# Number of users whose label and name indexes are kept by each process
+WINE_INDEX_CACHE_SIZE = 100
+
+# Days after which consumed bottles are moved to the storage item archive
+STORAGE_ARCHIVE_AFTER_DAYS = 90
+# Number of consumed bottles archived per transaction
+STORAGE_ARCHIVE_BATCH_SIZE = 1000
+
 MAP_BASEURL = "https://tiles.openfreemap.org/styles/liberty"
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
@@ -188,3 +221,6 @@ SITE_URL = "http://127.0.0.1:8003"
 ACCOUNT_ADAPTER = (
     "wine_cellar.apps.user.signup_adapter.ConfigurableSignupAccountAdapter"
 )
+
+# Run celery tasks (e.g. thumbnail generation) inline when no worker is running
+CELERY_TASK_ALWAYS_EAGER = True
@@ -25,9 +25,11 @@ from wine_cellar.apps.storage.views import (
     StorageCreateView,
     StorageDeleteView,
     StorageDetailView,
+    StorageGridView,
     StorageItemAddView,
     StorageItemDeleteView,
     StorageItemHistoryView,
+    StorageItemMoveView,
     StorageListView,
     StorageUpdateView,
 )
@@ -37,6 +39,7 @@ from wine_cellar.apps.wine.views import (
     WineCreateView,
     WineDeleteView,
     WineDetailView,
+    WineDuplicatesView,
     WineListView,
     WineMapView,
     WineScannedView,
@@ -51,12 +54,17 @@ urlpatterns = [
     path("user/settings/", UserSettingsView.as_view(), name="user-settings"),
     path("storages/", StorageListView.as_view(), name="storage-list"),
     path("storage/<int:pk>/", StorageDetailView.as_view(), name="storage-detail"),
+    path("storage/<int:pk>/grid.json", StorageGridView.as_view(), name="storage-grid"),
     path("storage/add/", StorageCreateView.as_view(), name="storage-add"),
     path("storage/delete/<int:pk>/", StorageDeleteView.as_view(), name="storage-delete"),
     path("storage/edit/<int:pk>/", StorageUpdateView.as_view(), name="storage-edit"),
     path("stock/add/<int:pk>/", StorageItemAddView.as_view(), name="stock-add"),
     path("stock/delete/<int:pk>/", StorageItemDeleteView.as_view(), name="stock-delete"),
+    path("stock/move/", StorageItemMoveView.as_view(), name="stock-move"),
     path("wine/add/", WineCreateView.as_view(), name="wine-add"),
+    path(
+        "wine/duplicates.json", WineDuplicatesView.as_view(), name="wine-duplicates"
+    ),
     path("wine/add/<str:code>/", WineCreateView.as_view(), name="wine-add"),
     path("wine/<int:pk>/", WineDetailView.as_view(), name="wine-detail"),
     path("wine/edit/<int:pk>/", WineUpdateView.as_view(), name="wine-edit"),
@@ -2,6 +2,8 @@ import React from 'react'
 import django from 'django'
 import { MapPopup } from './MapPopup'
 
+const IMAGE_HEIGHT = 100
+
 const translations = {
   country: django.pgettext('Singular', 'Country'),
   image_alt: django.gettext('Picture of a wine bottle.'),
@@ -16,14 +18,35 @@ const translations = {
  * @returns {JSX.Element} The JSX element representing the popup.
  */
 export const ItemPopup = ({ feature }) => {
+  const { image_aspect: aspect, image_placeholder: placeholder } =
+    feature.properties
+  const width = aspect ? Math.round(IMAGE_HEIGHT * aspect) : undefined
+  const sizes = width ? `${width}px` : undefined
+  // show the inline placeholder until the image is loaded
+  const style = placeholder
+    ? { background: `center / cover url(${placeholder})` }
+    : undefined
   return (
     <MapPopup feature={feature}>
       <div className="popup-image">
-        <img
-          src={feature.properties.image}
-          alt={translations.image_alt}
-          height="100"
-        />
+        <picture>
+          {feature.properties.image_webp_srcset && (
+            <source
+              type="image/webp"
+              srcSet={feature.properties.image_webp_srcset}
+              sizes={sizes}
+            />
+          )}
+          <img
+            src={feature.properties.image}
+            srcSet={feature.properties.image_srcset || undefined}
+            sizes={sizes}
+            alt={translations.image_alt}
+            height={IMAGE_HEIGHT}
+            width={width}
+            style={style}
+          />
+        </picture>
       </div>
       <div className="popup-content">
         <a href={feature.properties.url} className="popup-title">